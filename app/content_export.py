@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Structured JSONL content export
+- One line per page, straight from extract_structured_content (no markdown round trip)
+- Items in document order with heading path and source Tilda record
+- Optional gzip (.jsonl.gz), flushed per page so partial runs stay readable
+"""
+
+import json
+import threading
+from pathlib import Path
+
+from crawl_io import open_text
+
+# Item fields copied through when present (t-store products carry the extra ones)
+ITEM_FIELDS = ('type', 'level', 'text', 'record_id', 'record_type',
+               'price', 'price_old', 'description', 'options', 'uid')
+
+
+def export_items(content_data):
+    """
+    Content items in document order, each with 'order' and 'heading_path'.
+
+    t-store products take their store block's position. Items without a
+    document position (text-sweep fallback, products of a block outside the
+    main content) keep their extraction order after the positioned ones.
+    heading_path lists the enclosing headings, outermost first; accordion
+    content also gets its accordion title. Unplaced products get an empty
+    heading_path rather than whatever heading happened to come last.
+    """
+    content = content_data['content']
+    ordered = sorted(
+        range(len(content)),
+        key=lambda i: (content[i].get('position') is None, content[i].get('position') or 0, i),
+    )
+
+    headings = []      # [(level, text)]
+    accordion = None
+    items = []
+
+    for order, index in enumerate(ordered):
+        item = content[index]
+        content_type = item['type']
+
+        if content_type == 'heading':
+            level = item.get('level') or 1
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            path = [text for _, text in headings]
+            headings.append((level, item['text']))
+            accordion = None
+        else:
+            path = [text for _, text in headings]
+            if content_type == 'product' and item.get('position') is None:
+                path = []
+            elif content_type == 'accordion_title':
+                accordion = item['text']
+            elif content_type == 'accordion_content' and accordion:
+                path.append(accordion)
+
+        record = {'order': order}
+        for field in ITEM_FIELDS:
+            if item.get(field) is not None:
+                record[field] = item[field]
+        record['heading_path'] = path
+        items.append(record)
+
+    return items
+
+def page_record(content_data, canonical=None, filename=None):
+    """One export line for a page"""
+    record = {
+        'url': content_data['url'],
+        'canonical': canonical or content_data.get('canonical'),
+        'title': content_data['title'],
+        'description': content_data['description'],
+    }
+    if filename:
+        record['filename'] = filename
+    if content_data.get('fallback'):
+        record['fallback'] = content_data['fallback']
+    record['items'] = export_items(content_data)
+    return record
+
+
+class ContentExporter:
+    """Appends page records to a .jsonl or .jsonl.gz file; safe to share between threads"""
+
+    def __init__(self, export_file):
+        self.path = Path(export_file)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open_text(self.path, 'wt')
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.items = 0
+
+    def write(self, content_data, canonical=None, filename=None):
+        record = page_record(content_data, canonical, filename)
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.pages += 1
+            self.items += len(record['items'])
+
+    def stats(self):
+        return {'file': str(self.path), 'pages': self.pages, 'items': self.items}
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def iter_content_export(export_file):
+    """Stream page records back from an export"""
+    with open_text(export_file) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_export_items(export_file):
+    """Stream (page_url, item) pairs, for loaders that want one row per item"""
+    for page in iter_content_export(export_file):
+        for item in page['items']:
+            yield page['url'], item
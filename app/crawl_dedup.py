@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Crawl-wide deduplication
+- URL canonicalization before scheduling (scheme, www, trailing slash, tracking params, anchors)
+- <link rel="canonical">: alias pages are held until the declared page is written (and fetched if not listed);
+  an alias whose declared page never gets written is kept under its own URL
+- Content-hash index after fetch, so identical pages are written once
+"""
+
+import hashlib
+import json
+import re
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+TRACKING_PARAM_RE = re.compile(r'^(utm_\w+|gclid|yclid|fbclid|ysclid|_openstat|roistat\w*|tildaspec\w*)$', re.I)
+
+# t-store product fields that count as content besides the title in 'text'
+PRODUCT_HASH_FIELDS = ('price', 'price_old', 'description', 'options')
+
+
+def canonicalize_url(url):
+    """
+    Canonical form used for scheduling and dedup.
+
+    https, lowercase host without www., no fragment, no tracking params,
+    sorted query, no trailing slash (except the root).
+    """
+    parts = urlsplit(url.strip())
+    if parts.scheme not in ('http', 'https'):
+        return url.strip()
+
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAM_RE.match(k)]
+    query.sort()
+
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+def filename_for_url(canonical_url):
+    """Output path (relative, .md) for a canonical URL"""
+    parts = urlsplit(canonical_url)
+    name = parts.path
+    if parts.query:
+        name += '?' + parts.query
+
+    filename = re.sub(r'[^\w\-_/]', '_', name)
+    filename = re.sub(r'_+', '_', filename).strip('_/')
+    return (filename or 'index') + '.md'
+
+def content_hash(content_data):
+    """Hash of the extracted text and product fields (ignores URL and markup differences)"""
+    digest = hashlib.sha1()
+    digest.update(content_data.get('title', '').encode('utf-8'))
+    for item in content_data.get('content', []):
+        digest.update(b'\x00')
+        digest.update(re.sub(r'\s+', ' ', item.get('text', '')).strip().lower().encode('utf-8'))
+
+        product = {field: item[field] for field in PRODUCT_HASH_FIELDS if item.get(field)}
+        if product:
+            digest.update(b'\x01')
+            digest.update(json.dumps(product, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class CrawlDeduplicator:
+    """Tracks which canonical URLs and which page contents have already been handled in a run"""
+
+    def __init__(self):
+        self.claimed = {}       # canonical url -> first url that claimed it
+        self.hashes = {}        # content hash -> canonical url written
+        self.filenames = {}     # filename -> canonical url
+        self.declared = {}      # canonical url -> link href, declared by an alias and not claimed yet
+        self.written = set()    # canonical urls written to disk
+        self.held = {}          # alias canonical url -> (declared canonical url, caller's page)
+        self.duplicates = 0
+        self.aliases = 0
+        self._lock = threading.Lock()
+
+    def claim_url(self, url):
+        """
+        Claim a URL before fetching.
+
+        Returns (canonical, duplicate_of): duplicate_of is None if the page
+        should be fetched, otherwise the URL that already covers it.
+        """
+        canonical = canonicalize_url(url)
+        with self._lock:
+            if canonical in self.claimed:
+                self.duplicates += 1
+                return canonical, self.claimed[canonical]
+
+            self.claimed[canonical] = url
+            return canonical, None
+
+    def resolve_canonical_link(self, canonical, link_href):
+        """
+        Honor <link rel="canonical"> after fetch.
+
+        Returns the declared canonical URL if the page is an alias of another
+        page on the same host, else None. The caller hands the alias to
+        hold_alias(); the declared page is written from its own fetch, whatever
+        the crawl order. Declared pages not claimed yet are returned later by
+        pop_declared().
+        """
+        if not link_href:
+            return None
+
+        declared = canonicalize_url(link_href)
+        if declared == canonical or urlsplit(declared).hostname != urlsplit(canonical).hostname:
+            return None
+
+        with self._lock:
+            if declared not in self.claimed:
+                self.declared.setdefault(declared, link_href)
+            return declared
+
+    def hold_alias(self, canonical, declared, page):
+        """
+        Keep an alias page until its declared page is written.
+
+        Returns False if the declared page is already written (the alias is
+        not needed), True if page is held for mark_written() / pop_held().
+        """
+        with self._lock:
+            if declared in self.written:
+                self.aliases += 1
+                return False
+
+            self.held[canonical] = (declared, page)
+            return True
+
+    def mark_written(self, canonical):
+        """Record a written page; returns the held alias pages it makes unnecessary"""
+        with self._lock:
+            self.written.add(canonical)
+            released = [alias for alias, (declared, _) in self.held.items() if declared == canonical]
+            self.aliases += len(released)
+            return [self.held.pop(alias)[1] for alias in released]
+
+    def pop_held(self):
+        """
+        Aliases whose declared page was never written (failed, missing, or
+        itself an alias), as (page, declared, cycle) in hold order. cycle is
+        True if following the declared pages leads back to the alias.
+        """
+        with self._lock:
+            held, self.held = self.held, {}
+
+        unresolved = []
+        for alias, (declared, page) in held.items():
+            seen = {alias}
+            target = declared
+            while target in held and target not in seen:
+                seen.add(target)
+                target = held[target][0]
+            unresolved.append((page, declared, target == alias))
+        return unresolved
+
+    def pop_declared(self):
+        """Link hrefs of declared canonical pages that have not been claimed (fetched) yet"""
+        with self._lock:
+            hrefs = [href for declared, href in self.declared.items() if declared not in self.claimed]
+            self.declared = {}
+            return hrefs
+
+    def claim_content(self, canonical, content_data):
+        """Returns the canonical URL already written with identical content, or None"""
+        digest = content_hash(content_data)
+        with self._lock:
+            if digest in self.hashes:
+                self.duplicates += 1
+                return self.hashes[digest]
+
+            self.hashes[digest] = canonical
+            return None
+
+    def filename_for(self, canonical):
+        """Unique output filename; distinct URLs that sanitize to the same name get a hash suffix"""
+        filename = filename_for_url(canonical)
+        owner = self.filenames.get(filename)
+        if owner is not None and owner != canonical:
+            suffix = hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:8]
+            filename = f"{filename[:-3]}_{suffix}.md"
+        self.filenames[filename] = canonical
+        return filename
+
+    def stats(self):
+        return {
+            'unique_urls': len(self.claimed),
+            'unique_contents': len(self.hashes),
+            'duplicates_skipped': self.duplicates,
+            'canonical_aliases_skipped': self.aliases,
+        }
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Streaming crawl input/output for very large sites
+- Lazy page lists from .json, .jsonl and .jsonl.gz structure files
+- Per-page summary log (JSONL, one line per page, flushed as written)
+- Small rolled-up totals file rewritten periodically
+"""
+
+import gzip
+import json
+import threading
+from pathlib import Path
+
+TOTALS_EVERY = 100
+
+
+def open_text(path, mode='rt'):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode.replace('t', ''), encoding='utf-8')
+
+def is_jsonl(path):
+    name = str(path)
+    return name.endswith('.jsonl') or name.endswith('.jsonl.gz') or name.endswith('.ndjson')
+
+def load_structure_pages(structure_file):
+    """
+    Page dicts ({'url': ...}) from a structure file.
+
+    .jsonl / .jsonl.gz are returned as a lazy iterator reading line by line:
+    each line is either a page object or a bare URL string. Legacy .json
+    files ({"pages": [...]}) are loaded whole and returned as a list.
+    """
+    if is_jsonl(structure_file):
+        return _iter_jsonl_pages(structure_file)
+
+    with open(structure_file, 'r', encoding='utf-8') as f:
+        return json.load(f)['pages']
+
+def _iter_jsonl_pages(structure_file):
+    with open_text(structure_file) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            page = json.loads(line)
+            if isinstance(page, str):
+                page = {'url': page}
+            yield page
+
+
+class SummaryWriter:
+    """
+    Streams per-page records to <summary>.jsonl and keeps only counters in memory.
+
+    The totals file (<summary>.json) is rewritten every TOTALS_EVERY records
+    and on close, so a crash loses at most the rolled-up numbers, never the log.
+    Safe to share between the threads of a pipelined crawl.
+    """
+
+    def __init__(self, summary_file, gzip_log=False):
+        self.totals_path = Path(summary_file)
+        self.totals_path.parent.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.totals_path.with_suffix('.jsonl.gz' if gzip_log else '.jsonl')
+        self._log = open_text(self.log_path, 'wt')
+        self.totals = {
+            'total_pages': 0,
+            'successfully_scraped': 0,
+            'failed': 0,
+            'log': self.log_path.name,
+        }
+        self.extra = {}
+        self._lock = threading.RLock()
+
+    def _write(self, record):
+        with self._lock:
+            self._log.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._log.flush()
+
+            self.totals['total_pages'] += 1
+            if self.totals['total_pages'] % TOTALS_EVERY == 0:
+                self.write_totals()
+
+    def page(self, url, filename, lines, **extra):
+        with self._lock:
+            self.totals['successfully_scraped'] += 1
+            self._write({'status': 'ok', 'url': url, 'filename': filename, 'lines': lines, **extra})
+
+    def error(self, url, error, **extra):
+        with self._lock:
+            self.totals['failed'] += 1
+            self._write({'status': 'error', 'url': url, 'error': error, **extra})
+
+    def skipped(self, url, reason, **extra):
+        with self._lock:
+            self.count('skipped')
+            self._write({'status': 'skipped', 'url': url, 'reason': reason, **extra})
+
+    def count(self, key, n=1):
+        """Bump an extra counter in the totals file"""
+        with self._lock:
+            self.totals[key] = self.totals.get(key, 0) + n
+
+    def write_totals(self):
+        with self._lock:
+            tmp = self.totals_path.with_suffix('.json.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({**self.totals, **self.extra}, f, indent=2, ensure_ascii=False)
+            tmp.replace(self.totals_path)
+
+    def close(self):
+        self.write_totals()
+        self._log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def iter_summary_log(log_file):
+    """Stream records back from a summary log"""
+    with open_text(log_file) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
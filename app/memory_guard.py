@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Memory profiling and leak guard for long crawls
+- Current and peak RSS without extra dependencies (/proc, resource)
+- Opt-in per-page tracemalloc accounting with periodic snapshot diffs
+- Peak RSS per stage (fetch, extract, write)
+- Soft RSS limit: gc.collect() in-process; the pipeline also recycles parse workers
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 1048576
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (0.0 if unknown)"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS
+    return peak / (1048576 if sys.platform == 'darwin' else 1024)
+
+
+class MemoryProfiler:
+    """
+    Collects memory figures for a crawl run.
+
+    Stage and per-page figures are only recorded with enabled=True
+    (tracemalloc slows Python code down noticeably). check() enforces
+    rss_limit_mb either way.
+    """
+
+    def __init__(self, enabled=False, rss_limit_mb=None, snapshot_every=100, top=10):
+        self.enabled = enabled
+        self.rss_limit_mb = rss_limit_mb
+        self.snapshot_every = snapshot_every
+        self.top = top
+        self.pages = 0
+        self.stage_peaks = {}
+        self.collections = 0
+        self._collect_above_mb = rss_limit_mb
+        self.top_growth = []
+        self._baseline = None
+
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """Record the RSS reached by the end of a stage"""
+        if not self.enabled:
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            self.record_stage(name, rss_mb())
+
+    def record_stage(self, name, value_mb):
+        self.stage_peaks[name] = round(max(self.stage_peaks.get(name, 0.0), value_mb), 1)
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    def page(self):
+        """
+        Per-page figures for the summary log (None when disabled).
+
+        Every snapshot_every pages the largest allocation growth since the
+        first page is refreshed in top_growth.
+        """
+        if not self.enabled:
+            return None
+
+        self.pages += 1
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        if self._baseline is None:
+            self._baseline = self._snapshot()
+        elif self.pages % self.snapshot_every == 0:
+            self._update_growth()
+
+        return {
+            'traced_kb': current // 1024,
+            'traced_peak_kb': peak // 1024,
+            'rss_mb': round(rss_mb(), 1),
+        }
+
+    def _update_growth(self):
+        diff = self._snapshot().compare_to(self._baseline, 'lineno')
+        self.top_growth = [
+            {
+                'where': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_diff_kb': stat.size_diff // 1024,
+                'count_diff': stat.count_diff,
+            }
+            for stat in diff[:self.top]
+            if stat.size_diff > 0
+        ]
+
+    def check(self):
+        """
+        Run a full collection if RSS is over the limit; returns True if it did.
+
+        If RSS stays above the limit (memory the allocator does not give
+        back), the next collection waits until RSS grows another 10%.
+        """
+        if not self.rss_limit_mb or rss_mb() < self._collect_above_mb:
+            return False
+
+        gc.collect()
+        self.collections += 1
+        self._collect_above_mb = max(self.rss_limit_mb, rss_mb() * 1.1)
+        return True
+
+    def stats(self):
+        """Summary block for the run report"""
+        stats = {
+            'rss_mb': round(rss_mb(), 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'rss_limit_mb': self.rss_limit_mb,
+            'gc_collections': self.collections,
+        }
+
+        if self.enabled:
+            if self._baseline is not None and self.pages % self.snapshot_every:
+                self._update_growth()
+            current, _ = tracemalloc.get_traced_memory()
+            stats.update({
+                'profiled_pages': self.pages,
+                'traced_kb': current // 1024,
+                'stage_peak_rss_mb': self.stage_peaks,
+                'top_growth': self.top_growth,
+            })
+
+        return stats
+
+    def close(self):
+        if self.enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Staged crawl pipeline
+- Fetch stage: I/O-bound worker threads
+- Parse stage: process pool for extraction and markdown rendering (not serialized by the GIL)
+- Write stage: caller's callback, always in the calling thread
+- Bounded queues between stages for backpressure; clean shutdown on Ctrl-C
+- Parse workers are recycled after a number of pages or above an RSS limit
+"""
+
+import os
+import sys
+import queue
+import signal
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+# Parse workers are spawned fresh and import this module by file location
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'scrapedo-web-scraper' / 'scripts'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from production_scraper_v2 import extract_structured_content, content_to_markdown
+from tilda_store import append_store_products
+from memory_guard import rss_mb
+
+_STOP = object()
+_POLL = 0.2
+
+
+def _ignore_sigint():
+    """Parse workers leave Ctrl-C to the parent, which shuts the pool down"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def parse_page(html, url):
+    """Parse-stage task: extract, add t-store products, render markdown"""
+    content_data = extract_structured_content(html, url)
+    if content_data['store_blocks']:
+        append_store_products(content_data)
+    return content_data, content_to_markdown(content_data)
+
+def _parse_task(html, url):
+    return parse_page(html, url), rss_mb()
+
+
+class Pipeline:
+    """
+    fetch(url) -> result dict (as fetch_via_scrapedo) runs on fetch_workers threads.
+    Successful results are parsed on parse_workers processes. write(item, result,
+    parsed, error) is called in the thread that called run(), in completion order
+    (a page is written when its parse finishes, not in fetch order); parsed is
+    (content_data, markdown) or None.
+
+    The parse pool is replaced by a fresh one after recycle_after pages per
+    worker, or when a worker reports RSS above worker_rss_limit_mb; the old
+    pool finishes its queued pages and exits.
+    """
+
+    def __init__(self, fetch, write, fetch_workers=8, parse_workers=None, queue_size=None,
+                 recycle_after=None, worker_rss_limit_mb=None):
+        self.fetch = fetch
+        self.write = write
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.queue_size = queue_size or 2 * (self.fetch_workers + self.parse_workers)
+        self.recycle_after = recycle_after
+        self.worker_rss_limit_mb = worker_rss_limit_mb
+        self._stop = threading.Event()
+        self._feed_error = None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._pool_tasks = 0
+        self.interrupted = False
+        self.recycles = 0
+        self.worker_peak_rss_mb = 0.0
+
+    def stop(self):
+        """Stop feeding new items; in-flight items are still written"""
+        self._stop.set()
+
+    def _feed(self, items, inbox):
+        try:
+            for item in items:
+                while not self._stop.is_set():
+                    try:
+                        inbox.put(item, timeout=_POLL)
+                        break
+                    except queue.Full:
+                        pass
+                if self._stop.is_set():
+                    break
+        except Exception as e:
+            self._feed_error = e
+        finally:
+            for _ in range(self.fetch_workers):
+                inbox.put(_STOP)
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.parse_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_ignore_sigint,
+        )
+
+    def _submit(self, html, url):
+        with self._pool_lock:
+            if self.recycle_after and self._pool_tasks >= self.recycle_after * self.parse_workers:
+                self._recycle_locked()
+            self._pool_tasks += 1
+            try:
+                return self._pool.submit(_parse_task, html, url)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed): its pages fail, the rest go to a fresh pool
+                self._recycle_locked()
+                return self._pool.submit(_parse_task, html, url)
+
+    def _recycle_locked(self):
+        self._pool.shutdown(wait=False)
+        self._pool = self._new_pool()
+        self._pool_tasks = 0
+        self.recycles += 1
+
+    def _fetch_loop(self, inbox, outbox, parse_slots):
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                outbox.put(_STOP)
+                return
+
+            if self._stop.is_set():
+                continue
+
+            url = item[0]
+            try:
+                result = self.fetch(url)
+            except Exception as e:
+                result = {'success': False, 'content': f"Failed: {str(e)}"}
+
+            future = None
+            if result.get('success'):
+                parse_slots.acquire()
+                future = self._submit(result.pop('html'), url)
+                future.add_done_callback(lambda _: parse_slots.release())
+
+            outbox.put((item, result, future))
+
+    def _drain(self, outbox, finished, pending):
+        """
+        Write stage: hand results to write() until every fetch worker has stopped
+        and every pending parse is written. Fetch failures are written as they
+        arrive, parsed pages as soon as their parse finishes, so one slow page
+        does not hold back the ones behind it.
+        """
+        while finished[0] < self.fetch_workers or pending:
+            # Block on the outbox only when nothing is being parsed
+            try:
+                entry = outbox.get(block=not pending, timeout=_POLL)
+            except queue.Empty:
+                entry = None
+
+            if entry is _STOP:
+                finished[0] += 1
+            elif entry is not None:
+                item, result, future = entry
+                if future is None:
+                    self.write(item, result, None, None)
+                else:
+                    pending[future] = (item, result)
+
+            if pending:
+                done, _ = wait(pending, timeout=0 if entry is not None else _POLL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, result = pending.pop(future)
+                    self._write_parsed(item, result, future)
+
+    def _write_parsed(self, item, result, future):
+        parsed = None
+        error = None
+        try:
+            parsed, worker_rss = future.result()
+            self.worker_peak_rss_mb = max(self.worker_peak_rss_mb, worker_rss)
+            if self.worker_rss_limit_mb and worker_rss > self.worker_rss_limit_mb:
+                with self._pool_lock:
+                    if self._pool_tasks:
+                        self._recycle_locked()
+        except Exception as e:
+            error = f"Failed: {str(e)}"
+
+        self.write(item, result, parsed, error)
+
+    def run(self, items):
+        """
+        Process items (tuples whose first element is the URL) through all stages.
+
+        The first Ctrl-C stops feeding and writes what is already in flight;
+        a second one aborts. Returns False if interrupted, True otherwise.
+        """
+        inbox = queue.Queue(maxsize=self.queue_size)
+        outbox = queue.Queue(maxsize=self.queue_size)
+        parse_slots = threading.BoundedSemaphore(self.queue_size)
+
+        self._pool = self._new_pool()
+
+        threads = [threading.Thread(target=self._feed, args=(items, inbox), daemon=True)]
+        threads += [
+            threading.Thread(target=self._fetch_loop, args=(inbox, outbox, parse_slots), daemon=True)
+            for _ in range(self.fetch_workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        finished = [0]
+        pending = {}    # parse future -> (item, fetch result), until written
+        try:
+            try:
+                self._drain(outbox, finished, pending)
+            except KeyboardInterrupt:
+                self.interrupted = True
+                self.stop()
+                print("\nInterrupted, writing in-flight pages (Ctrl-C again to abort)...")
+                self._drain(outbox, finished, pending)
+        except KeyboardInterrupt:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+        if self._feed_error is not None:
+            raise self._feed_error
+
+        return not self.interrupted
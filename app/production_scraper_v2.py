@@ -8,13 +8,24 @@ Production Web Scraper v2 with Accordion Support
 """
 
 import sys
-import json
 import time
+import threading
 import re
 from pathlib import Path
+from urllib.parse import urljoin, urlparse
 sys.path.insert(0, 'scrapedo-web-scraper/scripts')
-from scrape import fetch_via_scrapedo
+from scrape import fetch_via_scrapedo, get_tokens
+from quota import QuotaManager, QuotaExceeded
+from resilience import FetchResilience, CircuitOpen
+from routing import FetchRouter
 from bs4 import BeautifulSoup
+import sitemap_planner
+from tilda_store import find_store_blocks, append_store_products
+from crawl_io import load_structure_pages, SummaryWriter
+from crawl_dedup import CrawlDeduplicator, content_hash
+from content_export import ContentExporter
+import revisit_scheduler
+from memory_guard import MemoryProfiler
 
 # Technical noise patterns
 TECH_NOISE_PATTERNS = [
@@ -34,6 +45,27 @@ TECH_NOISE_PATTERNS = [
     r'\[{.+li_type.+}\]',
 ]
 
+# Compiled once per process (long-running service mode reuses them)
+TECH_NOISE_RE = [re.compile(pattern, re.IGNORECASE) for pattern in TECH_NOISE_PATTERNS]
+CHROME_CLASS_RE = re.compile(r'header|footer|menu|nav', re.I)
+TILDA_COMPONENT_RE = re.compile(r'^t\d+__')
+TILDA_RECORD_ID_RE = re.compile(r'^rec(\d+)$')
+
+# Worst-case guards for extract_structured_content. Pages over a limit are
+# handled by a cheaper linear extraction and the reason is kept in 'fallback'.
+EXTRACTION_LIMITS = {
+    'max_input_chars': 5_000_000,   # longer HTML is truncated before parsing
+    'max_nodes': 60_000,            # tags under the main content container
+    'max_depth': 300,               # tag nesting depth
+    'cpu_time_budget': 10.0,        # seconds of thread CPU time for the full strategy
+}
+
+BLOCK_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol'}
+
+
+class ExtractionLimitExceeded(Exception):
+    """Raised inside extraction when a page exceeds EXTRACTION_LIMITS"""
+
 def is_tech_noise(text):
     """Check if text is technical noise"""
     if not text:
@@ -44,8 +76,8 @@ def is_tech_noise(text):
     if len(text_clean) < 3:
         return True
 
-    for pattern in TECH_NOISE_PATTERNS:
-        if re.search(pattern, text, re.IGNORECASE):
+    for pattern in TECH_NOISE_RE:
+        if pattern.search(text):
             return True
 
     if re.match(r'^[\d\s\.,;:!?\-—]+$', text_clean):
@@ -83,7 +115,8 @@ def extract_accordion_content(soup):
             if title and not is_tech_noise(title):
                 accordion_content.append({
                     'type': 'accordion_title',
-                    'text': title
+                    'text': title,
+                    'element': title_elem
                 })
 
         # Find content (usually hidden until expanded)
@@ -93,13 +126,70 @@ def extract_accordion_content(soup):
             if content and not is_tech_noise(content) and len(content) > 15:
                 accordion_content.append({
                     'type': 'accordion_content',
-                    'text': content
+                    'text': content,
+                    'element': content_elem
                 })
 
     return accordion_content
 
-def extract_structured_content(html, url):
+def index_tree(root, max_depth):
+    """
+    One linear pass over the tree.
+
+    Returns (nodes, info) where info[id(tag)] = [has_block_descendant,
+    div_descendants, inside_li, depth, position, record]. position is the
+    document order index, record the enclosing Tilda (record_id, record_type)
+    or None. Replaces per-element find()/find_all() lookups, which are
+    quadratic on deeply nested pages.
+    """
+    def record_of(node, inherited):
+        match = TILDA_RECORD_ID_RE.match(node.get('id') or '')
+        return (match.group(1), node.get('data-record-type')) if match else inherited
+
+    nodes = root.find_all(True)
+    info = {id(root): [False, 0, False, 0, -1, record_of(root, None)]}
+
+    # Document order: every parent is visited before its children
+    for position, node in enumerate(nodes):
+        parent = info[id(node.parent)]
+        depth = parent[3] + 1
+        if depth > max_depth:
+            raise ExtractionLimitExceeded(f"depth > {max_depth}")
+        info[id(node)] = [False, 0, parent[2] or node.parent.name == 'li', depth, position, record_of(node, parent[5])]
+
+    # Reverse order: every child is folded into its parent before the parent is folded
+    for node in reversed(nodes):
+        own = info[id(node)]
+        parent = info[id(node.parent)]
+        if own[0] or node.name in BLOCK_TAGS:
+            parent[0] = True
+        parent[1] += own[1] + (1 if node.name == 'div' else 0)
+
+    return nodes, info
+
+def extract_fallback_content(main_content, add_content):
+    """Cheap linear extraction: headings, then every visible text string"""
+    for element in main_content.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+        add_content('heading', element.get_text(), int(element.name[1]))
+
+    for text in main_content.stripped_strings:
+        add_content('paragraph', text)
+
+def extract_structured_content(html, url, limits=None):
     """Extract structured content including accordions"""
+    limits = {**EXTRACTION_LIMITS, **(limits or {})}
+    fallback = None
+
+    if len(html) > limits['max_input_chars']:
+        fallback = {'reason': f"input > {limits['max_input_chars']} chars", 'strategy': 'truncated'}
+        html = html[:limits['max_input_chars']]
+
+    deadline = time.thread_time() + limits['cpu_time_budget']
+
+    def check_budget():
+        if time.thread_time() > deadline:
+            raise ExtractionLimitExceeded(f"cpu time > {limits['cpu_time_budget']}s")
+
     soup = BeautifulSoup(html, 'html.parser')
 
     # Metadata
@@ -109,6 +199,12 @@ def extract_structured_content(html, url):
     meta_desc = soup.find('meta', attrs={'name': 'description'})
     description = clean_text(meta_desc.get('content', '')) if meta_desc else ""
 
+    canonical_link = soup.find('link', rel='canonical')
+    canonical = urljoin(url, canonical_link.get('href', '')) if canonical_link and canonical_link.get('href') else None
+
+    # t-store catalogs are rendered client-side; remember them before scripts are removed
+    store_blocks = find_store_blocks(soup)
+
     # Remove unwanted elements
     for element in soup(['script', 'style', 'noscript', 'svg', 'iframe', 'nav']):
         element.decompose()
@@ -117,10 +213,10 @@ def extract_structured_content(html, url):
         element.decompose()
 
     # Remove header/footer/menu/nav elements, but exclude Tilda-specific ones (like t585__header for accordions)
-    for element in soup.find_all(class_=re.compile(r'header|footer|menu|nav', re.I)):
+    for element in soup.find_all(class_=CHROME_CLASS_RE):
         classes = element.get('class', [])
         # Skip Tilda elements (those starting with 't' followed by digits)
-        if not any(re.match(r'^t\d+__', cls) for cls in classes):
+        if not any(TILDA_COMPONENT_RE.match(cls) for cls in classes):
             element.decompose()
 
     # Detect Tilda
@@ -140,9 +236,10 @@ def extract_structured_content(html, url):
     # Content structure
     content_structure = []
     seen_texts = set()
+    info = {}
 
-    def add_content(content_type, text, level=None):
-        """Add content with deduplication"""
+    def add_content(content_type, text, level=None, element=None):
+        """Add content with deduplication; element gives its document position and Tilda record"""
         text = clean_text(text)
 
         if is_tech_noise(text):
@@ -158,77 +255,121 @@ def extract_structured_content(html, url):
 
         seen_texts.add(normalized)
 
+        source = info.get(id(element)) if element is not None else None
+        record = source[5] if source and source[5] else (None, None)
+
         content_structure.append({
             'type': content_type,
             'text': text,
-            'level': level
+            'level': level,
+            'position': source[4] if source else None,
+            'record_id': record[0],
+            'record_type': record[1]
         })
 
-    # Extract accordion content FIRST (important!)
-    accordion_items = extract_accordion_content(main_content)
-    for item in accordion_items:
-        add_content(item['type'], item['text'])
-
-    # Collect headings
-    for element in main_content.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-        level = int(element.name[1])
-        text = element.get_text()
-        add_content('heading', text, level)
+    try:
+        nodes, info = index_tree(main_content, limits['max_depth'])
+        if len(nodes) > limits['max_nodes']:
+            raise ExtractionLimitExceeded(f"{len(nodes)} nodes > {limits['max_nodes']}")
+
+        # t-store products are placed after the last node of their store block's record
+        record_ends = {}
+        for node in nodes:
+            source = info[id(node)]
+            if source[5]:
+                record_ends[source[5][0]] = source[4]
+        for block in store_blocks:
+            block['position'] = record_ends.get(block['recid'])
+
+        # Extract accordion content FIRST (important!)
+        accordion_items = extract_accordion_content(main_content)
+        for item in accordion_items:
+            add_content(item['type'], item['text'], element=item['element'])
+
+        # Collect headings
+        for element in main_content.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+            level = int(element.name[1])
+            text = element.get_text()
+            add_content('heading', text, level, element)
 
-    # Collect paragraphs
-    for element in main_content.find_all('p'):
-        text = element.get_text()
-        add_content('paragraph', text)
+        check_budget()
 
-    # Collect list items
-    for element in main_content.find_all('li'):
-        if not element.find_parent('li'):
+        # Collect paragraphs
+        for element in main_content.find_all('p'):
             text = element.get_text()
-            add_content('list_item', text)
-
-    # Tilda text classes
-    tilda_text_classes = [
-        'tn-atom',
-        't-descr',
-        't491__content',
-        't-card__descr',
-        't-text',
-        't-section__descr',
-    ]
-
-    for class_name in tilda_text_classes:
-        for element in main_content.find_all('div', class_=lambda x: x and class_name in x):
-            if element.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol']):
+            add_content('paragraph', text, element=element)
+            check_budget()
+
+        # Collect list items
+        for element in main_content.find_all('li'):
+            if not info[id(element)][2]:
+                text = element.get_text()
+                add_content('list_item', text, element=element)
+                check_budget()
+
+        # Tilda text classes
+        tilda_text_classes = [
+            'tn-atom',
+            't-descr',
+            't491__content',
+            't-card__descr',
+            't-text',
+            't-section__descr',
+        ]
+
+        for class_name in tilda_text_classes:
+            for element in main_content.find_all('div', class_=lambda x: x and class_name in x):
+                if info[id(element)][0]:
+                    continue
+
+                text = element.get_text(separator=' ', strip=True)
+
+                if text and len(text) > 15:
+                    add_content('paragraph', text, element=element)
+
+                check_budget()
+
+        # Other divs
+        for node in nodes:
+            if node.name != 'div':
                 continue
 
-            text = element.get_text(separator=' ', strip=True)
+            elem_classes = node.get('class', [])
+            if any(tc in ' '.join(elem_classes) for tc in tilda_text_classes):
+                continue
 
-            if text and len(text) > 15:
-                add_content('paragraph', text)
+            has_block, div_descendants = info[id(node)][:2]
+            if has_block or div_descendants > 1:
+                continue
 
-    # Other divs
-    for element in main_content.find_all('div'):
-        elem_classes = element.get('class', [])
-        if any(tc in ' '.join(elem_classes) for tc in tilda_text_classes):
-            continue
+            text = node.get_text(separator=' ', strip=True)
 
-        if element.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol']):
-            continue
+            if text and len(text) > 15:
+                add_content('paragraph', text, element=node)
 
-        child_divs = element.find_all('div')
-        if len(child_divs) > 1:
-            continue
+            check_budget()
 
-        text = element.get_text(separator=' ', strip=True)
+    except (ExtractionLimitExceeded, RecursionError) as e:
+        reason = str(e) or type(e).__name__
+        fallback = {'reason': reason if not fallback else f"{fallback['reason']}; {reason}", 'strategy': 'text_sweep'}
+        # The sweep is not in document order, so no item keeps a position
+        for item in content_structure:
+            item['position'] = None
+        for block in store_blocks:
+            block['position'] = None
+        extract_fallback_content(main_content, add_content)
 
-        if text and len(text) > 15:
-            add_content('paragraph', text)
+    # Only plain strings are returned; break the tree's parent/child cycles now instead of at the next GC
+    soup.decompose()
 
     return {
         'title': title_text,
         'url': url,
         'description': description,
-        'content': content_structure
+        'canonical': canonical,
+        'content': content_structure,
+        'store_blocks': store_blocks,
+        'fallback': fallback
     }
 
 def content_to_markdown(content_data):
@@ -280,6 +421,21 @@ def content_to_markdown(content_data):
             lines.append(f"- {text}")
             list_active = True
 
+        elif content_type == 'product':
+            if list_active:
+                lines.append("")
+            lines.append(f"\n### {text}\n")
+            if item.get('price'):
+                price = item['price']
+                if item.get('price_old'):
+                    price += f" (~~{item['price_old']}~~)"
+                lines.append(f"**Price:** {price}\n")
+            if item.get('description'):
+                lines.append(f"{item['description']}\n")
+            for option in item.get('options', []):
+                lines.append(f"- {option['title']}: {', '.join(option['values'])}")
+            list_active = bool(item.get('options'))
+
         prev_type = content_type
 
     # Clean up
@@ -288,101 +444,468 @@ def content_to_markdown(content_data):
 
     return markdown
 
-def scrape_page_v2(url):
-    """Scrape page with accordion support"""
+def fetch_and_extract(url, quota=None, resilience=None, router=None, fetch=None, memory=None):
+    """Fetch a page and return its structured content (None on fetch error)"""
     print(f"Fetching: {url}")
+    memory = memory or MemoryProfiler()
+
+    with memory.stage('fetch'):
+        if fetch:
+            result = fetch(url)
+        elif router:
+            result = router.fetch(url, quota=quota, resilience=resilience, with_text=False)
+        else:
+            result = fetch_via_scrapedo(url, quota=quota, resilience=resilience, with_text=False)
+
+    if result.get('quota_exceeded'):
+        raise QuotaExceeded(result['content'])
 
-    result = fetch_via_scrapedo(url)
+    if result.get('circuit_open'):
+        raise CircuitOpen(result['content'])
 
     if not result['success']:
         print(f"  ✗ Error: {result['content']}")
         return None
 
-    print("  Extracting content...")
-    content_data = extract_structured_content(result['html'], url)
+    print(f"  Extracting content{' (direct)' if result.get('route') == 'direct' else ''}...")
+    with memory.stage('extract'):
+        # pop: the raw HTML is not kept alive through store requests and writing
+        content_data = extract_structured_content(result.pop('html'), url)
+
+        if content_data['store_blocks']:
+            added = append_store_products(content_data)
+            errors = content_data['store']['errors']
+            print(f"  Store: {added} products from {len(content_data['store_blocks'])} block(s)"
+                  f"{f', {len(errors)} failed' if errors else ''}")
+
+    if content_data['fallback']:
+        print(f"  ! Extraction fallback ({content_data['fallback']['strategy']}): {content_data['fallback']['reason']}")
 
     print(f"  Found {len(content_data['content'])} elements")
 
-    markdown = content_to_markdown(content_data)
+    return content_data
 
-    return markdown
+def scrape_page_v2(url, quota=None):
+    """Scrape page with accordion support"""
+    content_data = fetch_and_extract(url, quota=quota)
+
+    if content_data is None:
+        return None
 
-def rescrape_all_pages(structure_file='../utrace_structure.json', output_dir='../result/utrace/scraped_content'):
-    """Rescrape all pages"""
-    with open(structure_file, 'r', encoding='utf-8') as f:
-        structure = json.load(f)
+    return content_to_markdown(content_data)
+
+def make_quota_manager(credit_budget=None, site_budget=None, max_concurrency=5):
+    """Build a QuotaManager over all configured Scrape.do tokens (None if there are none)"""
+    tokens = get_tokens()
+    if not tokens:
+        return None
+
+    return QuotaManager(
+        tokens,
+        max_concurrency=max_concurrency,
+        budget=credit_budget,
+        site_budget=site_budget,
+    )
+
+def run_pipelined(candidates, write_page, summary, quota, resilience, router,
+                  fetch_workers, parse_workers, request_delay, fetch=None, memory=None,
+                  recycle_after=None, deferred=None):
+    """
+    Staged variant of the rescrape loop: fetch threads -> parse processes -> write_page here.
+
+    Pages whose host circuit is open are appended to deferred as (url, canonical)
+    instead of blocking a fetch thread. Returns False if the run stopped early
+    (Ctrl-C or quota).
+    """
+    from pipeline import Pipeline
+
+    memory = memory or MemoryProfiler()
+    deferred = [] if deferred is None else deferred
+    quota_stop = threading.Event()
+
+    def route(url):
+        if fetch:
+            return fetch(url)
+        if router:
+            return router.fetch(url, quota=quota, resilience=resilience, with_text=False)
+        return fetch_via_scrapedo(url, quota=quota, resilience=resilience, with_text=False)
+
+    def fetch_one(url):
+        with memory.stage('fetch'):
+            result = route(url)
+
+        if not result.get('circuit_open'):
+            time.sleep(request_delay)
+        return result
+
+    def write(item, result, parsed, error):
+        url, i, canonical = item
+        print(f"[{i}] {url}{' (direct)' if result.get('route') == 'direct' else ''}")
+
+        if result.get('quota_exceeded'):
+            print(f"  ✗ Stopping: {result['content']}")
+            summary.error(url, f"Quota: {result['content']}")
+            quota_stop.set()
+            pipeline.stop()
+        elif result.get('circuit_open'):
+            print(f"  … Deferred: {result['content']}")
+            deferred.append((url, canonical))
+        elif not result['success']:
+            print(f"  ✗ Error: {result['content']}")
+            summary.error(url, 'Fetch failed')
+        elif error:
+            print(f"  ✗ {error}")
+            summary.error(url, error)
+        else:
+            content_data, markdown = parsed
+            if content_data['fallback']:
+                print(f"  ! Extraction fallback ({content_data['fallback']['strategy']}): {content_data['fallback']['reason']}")
+            write_page(url, canonical, content_data, markdown)
+
+    pipeline = Pipeline(fetch_one, write, fetch_workers=fetch_workers, parse_workers=parse_workers,
+                        recycle_after=recycle_after, worker_rss_limit_mb=memory.rss_limit_mb)
+    print(f"Pipeline: {fetch_workers} fetch thread(s), {pipeline.parse_workers} parse process(es)\n")
+
+    completed = pipeline.run((url, i, canonical) for i, url, canonical in candidates)
+    if not completed:
+        summary.extra['interrupted'] = True
+
+    summary.extra['pipeline'] = {
+        'parse_worker_recycles': pipeline.recycles,
+        'parse_worker_peak_rss_mb': round(pipeline.worker_peak_rss_mb, 1),
+    }
+    memory.record_stage('extract', pipeline.worker_peak_rss_mb)
+    return completed and not quota_stop.is_set()
+
+def rescrape_all_pages(structure_file='../utrace_structure.json', output_dir='../result/utrace/scraped_content',
+                       credit_budget=None, site_budget=None,
+                       incremental=False, sitemap_url=None, state_file='../result/utrace/fetch_state.json',
+                       summary_file='../result/utrace/scraping_summary.json',
+                       revisit_state_file=None,
+                       direct_first=True, fetch_workers=8, parse_workers=0, request_delay=1.5,
+                       export_file=None, fetch=None,
+                       profile_memory=False, memory_limit_mb=None, recycle_after=None):
+    """
+    Rescrape all pages.
+
+    structure_file may be .json ({"pages": [...]}) or streamed .jsonl/.jsonl.gz.
+    Per-page results go to <summary_file>.jsonl as they happen; summary_file
+    itself only holds the rolled-up totals. incremental=True fetches only
+    pages new or changed per sitemap lastmod. Every fetch is also recorded
+    in the revisit scheduler's change history. direct_first=True tries a
+    plain HTTP fetch before Scrape.do and learns per host which route works.
+    parse_workers > 0 switches to the staged pipeline (pipeline.py): fetch_workers
+    threads fetch while parse_workers processes extract and render. request_delay
+    is the pause after each fetch, per fetch worker. export_file (.jsonl or
+    .jsonl.gz) additionally gets every written page as structured items
+    (content_export.py). fetch (url -> result dict as fetch_via_scrapedo)
+    replaces the network entirely, e.g. to read a site export archive;
+    structure_file may then also be an iterable of page dicts.
+    state_file set to None skips the fetch state (e.g. for offline ingestion).
+    The revisit change history is opt-in: with revisit_state_file (e.g.
+    revisit_scheduler.DEFAULT_STATE_FILE) every write adds a visit, and the
+    whole history is held in memory and saved at the end of the run.
+    profile_memory records tracemalloc/RSS figures per page and per stage
+    (memory_guard.py). Above memory_limit_mb RSS a full GC runs and
+    pipelined parse workers are recycled; recycle_after also recycles them
+    every N pages per worker. Recycling needs parse workers: with
+    parse_workers=0 memory_limit_mb only triggers the GC, and recycle_after
+    is rejected with ValueError.
+    """
+    if recycle_after and not parse_workers:
+        raise ValueError("recycle_after needs parse_workers > 0 (parse workers are what gets recycled)")
+
+    quota = make_quota_manager(credit_budget, site_budget) if fetch is None else None
 
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    results = []
-    errors = []
+    pages = load_structure_pages(structure_file) if isinstance(structure_file, (str, Path)) else structure_file
+    fetch_state = sitemap_planner.load_fetch_state(state_file) if state_file else {}
+    revisit_state = revisit_scheduler.load_state(revisit_state_file) if revisit_state_file else None
+    plan_stats = None
+
+    if incremental:
+        pages = list(pages)
+        sitemap_url = sitemap_url or sitemap_planner.default_sitemap_url(pages)
+        print(f"Planning from sitemap: {sitemap_url}")
+        sitemap_entries = sitemap_planner.fetch_sitemap_entries(sitemap_url, quota=quota) if sitemap_url else {}
+        pages, plan_stats = sitemap_planner.plan_pages(pages, sitemap_entries, fetch_state)
+        print(f"  Changed: {plan_stats['changed']}, new: {plan_stats['new']}, "
+              f"no lastmod: {plan_stats['no_lastmod']}, unchanged (skipped): {plan_stats['skipped_unchanged']}")
+
+    total = f"/{len(pages)}" if isinstance(pages, list) else ''
+    summary = SummaryWriter(summary_file)
+    dedup = CrawlDeduplicator()
+    resilience = FetchResilience()
+    router = FetchRouter() if direct_first and fetch is None else None
+    exporter = ContentExporter(export_file) if export_file else None
+    memory = MemoryProfiler(enabled=profile_memory, rss_limit_mb=memory_limit_mb)
+
+    if plan_stats:
+        summary.extra['plan'] = plan_stats
+
+    print(f"Scraping {len(pages) if total else 'streamed'} pages...\n")
+
+    def write_page(url, canonical, content_data, markdown=None, unresolved=None):
+        with memory.stage('write'):
+            write_content(url, canonical, content_data, markdown, unresolved)
+
+        if memory.check():
+            print(f"  ! RSS over {memory.rss_limit_mb} MB, ran full GC")
+
+    def write_content(url, canonical, content_data, markdown, unresolved=None):
+        # unresolved: summary fields of a held alias written at the end of the run
+        if unresolved is None:
+            if state_file:
+                sitemap_planner.record_fetch(fetch_state, url)
+            if revisit_state is not None and revisit_scheduler.record_visit(revisit_state, url, content_hash(content_data)):
+                summary.count('changed_since_last_visit')
+
+            declared = dedup.resolve_canonical_link(canonical, content_data['canonical'])
+            if declared:
+                if dedup.hold_alias(canonical, declared, (url, canonical, content_data, markdown)):
+                    print(f"  = Declares canonical {declared}, held until it is written")
+                else:
+                    print(f"  = Declares canonical {declared}, not written")
+                    summary.skipped(url, 'canonical link', canonical=declared)
+                return
+
+        duplicate_of = dedup.claim_content(canonical, content_data)
+        if duplicate_of:
+            print(f"  = Same content as {duplicate_of}, not written")
+            summary.skipped(url, 'duplicate content', duplicate_of=duplicate_of)
+            return
 
-    print(f"Scraping {len(structure['pages'])} pages...\n")
+        if markdown is None:
+            markdown = content_to_markdown(content_data)
+        filename = dedup.filename_for(canonical)
 
-    for i, page in enumerate(structure['pages'], 1):
-        url = page['url']
+        filepath = output_path / filename
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.write_text(markdown, encoding='utf-8')
 
-        if not url.startswith('http'):
-            print(f"[{i}/{len(structure['pages'])}] Skipping: {url}")
-            continue
+        print(f"  ✓ Saved to {filename}")
 
-        print(f"[{i}/{len(structure['pages'])}] ", end='')
+        if exporter:
+            exporter.write(content_data, canonical, filename)
 
-        try:
-            markdown = scrape_page_v2(url)
+        extra = {'canonical': canonical, **(unresolved or {})}
+        if content_data['fallback']:
+            extra['fallback'] = content_data['fallback']
+            summary.count('extraction_fallbacks')
 
-            if markdown:
-                # Generate filename
-                parsed_url = re.sub(r'https?://(www\.)?utrace\.ru/?', '', url)
-                filename = re.sub(r'[^\w\-_/]', '_', parsed_url)
-                filename = re.sub(r'_+', '_', filename).strip('_')
-                if not filename:
-                    filename = 'index'
-                filename += '.md'
+        store = content_data.get('store')
+        if store:
+            extra['store'] = store
+            for error in store['errors']:
+                print(f"  ! Store block {error['storepart_uid']} failed: {error['error']}")
+            if store['errors']:
+                summary.count('store_errors', len(store['errors']))
 
-                filepath = output_path / filename
-                filepath.parent.mkdir(parents=True, exist_ok=True)
-                filepath.write_text(markdown, encoding='utf-8')
+        page_memory = memory.page()
+        if page_memory:
+            extra['memory'] = page_memory
 
-                print(f"  ✓ Saved to {filename}")
+        summary.page(url, filename, markdown.count('\n') + 1, **extra)
 
-                results.append({
-                    'url': url,
-                    'filename': filename,
-                    'lines': len(markdown.split('\n'))
-                })
+        for alias_url, *_ in dedup.mark_written(canonical):
+            summary.skipped(alias_url, 'canonical link', canonical=canonical)
 
-                time.sleep(1.5)
+    def scrape_one(url, canonical):
+        content_data = fetch_and_extract(url, quota=quota, resilience=resilience, router=router, fetch=fetch,
+                                         memory=memory)
 
-        except Exception as e:
-            error_msg = f"Failed: {str(e)}"
-            print(f"  ✗ {error_msg}")
-            errors.append({'url': url, 'error': error_msg})
+        if not content_data:
+            summary.error(url, 'Fetch failed')
+            return
 
-    # Save summary
-    summary = {
-        'total_pages': len(structure['pages']),
-        'successfully_scraped': len(results),
-        'failed': len(errors),
-        'pages': results,
-        'errors': errors
-    }
+        write_page(url, canonical, content_data)
+
+    def candidates(pages, total):
+        for i, page in enumerate(pages, 1):
+            url = page['url']
 
-    with open('../result/utrace/scraping_summary.json', 'w', encoding='utf-8') as f:
-        json.dump(summary, f, indent=2, ensure_ascii=False)
+            if not url.startswith('http'):
+                print(f"[{i}{total}] Skipping: {url}")
+                summary.skipped(url, 'not http')
+                continue
+
+            canonical, duplicate_of = dedup.claim_url(url)
+            if duplicate_of:
+                print(f"[{i}{total}] Duplicate of {duplicate_of}: {url}")
+                summary.skipped(url, 'duplicate url', duplicate_of=duplicate_of)
+                continue
+
+            yield i, url, canonical
+
+    def retry_deferred(deferred):
+        """
+        Retry pages deferred by an open circuit: one probe per host after its
+        recovery window. If the probe fails the circuit reopens, and the host's
+        remaining pages are logged as unavailable without waiting again.
+        """
+        by_host = {}
+        for url, canonical in deferred:
+            by_host.setdefault(urlparse(url).netloc, []).append((url, canonical))
+
+        if deferred:
+            print(f"\nRetrying {len(deferred)} deferred page(s) on {len(by_host)} host(s)...")
+
+        for host, host_pages in by_host.items():
+            wait_for = resilience.breaker.retry_in(host)
+            if wait_for:
+                time.sleep(wait_for)
+
+            for url, canonical in host_pages:
+                if resilience.breaker.retry_in(host):
+                    print(f"[deferred] {url}: ✗ {host} still unavailable")
+                    summary.error(url, f"Host unavailable: {host}")
+                    continue
+
+                print("[deferred] ", end='')
+                try:
+                    scrape_one(url, canonical)
+                except CircuitOpen as e:
+                    print(f"  ✗ {e}")
+                    summary.error(url, f"Host unavailable: {e}")
+                except QuotaExceeded as e:
+                    print(f"  ✗ Stopping: {e}")
+                    summary.error(url, f"Quota: {e}")
+                    return
+                except Exception as e:
+                    error_msg = f"Failed: {str(e)}"
+                    print(f"  ✗ {error_msg}")
+                    summary.error(url, error_msg)
+
+    def write_held_aliases():
+        """Aliases whose declared page was never written are kept under their own URL"""
+        held = dedup.pop_held()
+        if held:
+            print(f"\nWriting {len(held)} alias page(s) whose canonical page was not written...")
+
+        for (url, canonical, content_data, markdown), declared, cycle in held:
+            print(f"[alias] {url} -> {declared}{' (canonical cycle)' if cycle else ''}")
+            unresolved = {'declared_canonical': declared}
+            if cycle:
+                unresolved['canonical_cycle'] = True
+                summary.count('canonical_cycles')
+            write_page(url, canonical, content_data, markdown, unresolved)
+
+    # Pages whose host circuit is open are retried after the main pass
+    deferred = []
+
+    def crawl(batch, total):
+        """One pass over a page batch; returns False if the run stopped early"""
+        if parse_workers:
+            return run_pipelined(candidates(batch, total), write_page, summary, quota, resilience, router,
+                                 fetch_workers, parse_workers, request_delay, fetch, memory,
+                                 recycle_after, deferred)
+        else:
+            for i, url, canonical in candidates(batch, total):
+                print(f"[{i}{total}] ", end='')
+
+                try:
+                    scrape_one(url, canonical)
+                    time.sleep(request_delay)
+
+                except CircuitOpen as e:
+                    print(f"  … Deferred: {e}")
+                    deferred.append((url, canonical))
+
+                except QuotaExceeded as e:
+                    print(f"  ✗ Stopping: {e}")
+                    summary.error(url, f"Quota: {e}")
+                    return False
+
+                except Exception as e:
+                    error_msg = f"Failed: {str(e)}"
+                    print(f"  ✗ {error_msg}")
+                    summary.error(url, error_msg)
+
+            return True
 
+    try:
+        finished = crawl(pages, total)
+
+        # Canonical pages declared by held aliases but missing from the page list
+        while finished:
+            declared = dedup.pop_declared()
+            if not declared:
+                break
+            print(f"\nFetching {len(declared)} declared canonical page(s)...")
+            finished = crawl([{'url': href} for href in declared], f"/{len(declared)}")
+
+        if finished:
+            retry_deferred(deferred)
+
+        write_held_aliases()
+
+    finally:
+        if state_file:
+            sitemap_planner.save_fetch_state(fetch_state, state_file)
+        if revisit_state is not None:
+            revisit_scheduler.save_state(revisit_state, revisit_state_file)
+
+        if quota:
+            summary.extra['quota'] = quota.stats()
+
+        summary.extra['dedup'] = dedup.stats()
+        summary.extra['resilience'] = resilience.stats()
+        if router:
+            summary.extra['routing'] = router.stats()
+        if exporter:
+            exporter.close()
+            summary.extra['export'] = exporter.stats()
+        if profile_memory or memory_limit_mb:
+            summary.extra['memory'] = memory.stats()
+        memory.close()
+        summary.close()
+
+    totals = summary.totals
     print(f"\n{'='*70}")
     print(f"Scraping complete!")
-    print(f"Successfully: {len(results)}/{len(structure['pages'])}")
-    print(f"Failed: {len(errors)}")
+    print(f"Successfully: {totals['successfully_scraped']}/{totals['total_pages']}")
+    print(f"Failed: {totals['failed']}")
+    if quota:
+        print(f"Credits spent: {quota.stats()['credits_spent']}")
     print(f"Output: {output_path.absolute()}")
+    print(f"Summary: {summary.totals_path} (log: {summary.log_path.name})")
 
 if __name__ == '__main__':
     import sys
 
     if len(sys.argv) > 1 and sys.argv[1] == 'all':
-        rescrape_all_pages()
+        # Optional: python3 production_scraper_v2.py all [<credit_budget>] [--changed] [--pages=<file.jsonl.gz>] [--scrapedo-only]
+        #           [--parse-workers=<N>] [--fetch-workers=<N>] [--export=<content.jsonl.gz>]
+        #           [--profile-memory] [--memory-limit=<MB>] [--recycle-after=<N>] [--revisit-state[=<file>]]
+        args = sys.argv[2:]
+        budget = next((int(a) for a in args if a.isdigit()), None)
+        kwargs = {}
+        for arg in args:
+            if arg.startswith('--pages='):
+                kwargs['structure_file'] = arg.split('=', 1)[1]
+            elif arg == '--scrapedo-only':
+                kwargs['direct_first'] = False
+            elif arg.startswith('--parse-workers='):
+                kwargs['parse_workers'] = int(arg.split('=', 1)[1])
+            elif arg.startswith('--fetch-workers='):
+                kwargs['fetch_workers'] = int(arg.split('=', 1)[1])
+            elif arg.startswith('--export='):
+                kwargs['export_file'] = arg.split('=', 1)[1]
+            elif arg == '--profile-memory':
+                kwargs['profile_memory'] = True
+            elif arg.startswith('--memory-limit='):
+                kwargs['memory_limit_mb'] = int(arg.split('=', 1)[1])
+            elif arg.startswith('--recycle-after='):
+                kwargs['recycle_after'] = int(arg.split('=', 1)[1])
+            elif arg == '--revisit-state':
+                kwargs['revisit_state_file'] = revisit_scheduler.DEFAULT_STATE_FILE
+            elif arg.startswith('--revisit-state='):
+                kwargs['revisit_state_file'] = arg.split('=', 1)[1]
+        if kwargs.get('recycle_after') and not kwargs.get('parse_workers'):
+            sys.exit("--recycle-after needs --parse-workers=<N>: only pipelined parse workers are recycled")
+        rescrape_all_pages(credit_budget=budget, incremental='--changed' in args, **kwargs)
     else:
         # Test on one page
         url = 'https://utrace.ru/utrace-hub'
@@ -394,4 +917,4 @@ if __name__ == '__main__':
                 f.write(markdown)
 
             print(f"\n✓ Saved to {output}")
-            print(f"Total lines: {len(markdown.split('\n'))}")
+            print(f"Total lines: {len(markdown.split(chr(10)))}")
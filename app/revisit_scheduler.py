@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Adaptive revisit scheduler
+- Records a content hash per URL on every visit
+- Estimates each page's change rate from its history
+- Spreads a global daily request budget over pages by change rate
+- `due` emits only the pages worth fetching now
+
+Usage:
+    python3 revisit_scheduler.py due --budget 200 [--pages ../utrace_structure.json] > due.jsonl
+    python3 production_scraper_v2.py all --pages=due.jsonl --revisit-state
+    python3 revisit_scheduler.py stats
+"""
+
+import json
+import math
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from crawl_dedup import canonicalize_url
+
+DEFAULT_STATE_FILE = '../result/utrace/revisit_state.json'
+
+HISTORY_LIMIT = 50
+PRIOR_CHANGES_PER_DAY = 1 / 7     # assumed rate until a page has history
+PRIOR_WEIGHT_DAYS = 7             # how many observed days the prior is worth
+MIN_INTERVAL_DAYS = 0.25
+MAX_INTERVAL_DAYS = 30
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _parse(value):
+    return datetime.fromisoformat(value) if value else None
+
+def load_state(state_file=DEFAULT_STATE_FILE):
+    path = Path(state_file)
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state, state_file=DEFAULT_STATE_FILE):
+    path = Path(state_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    tmp.replace(path)
+
+def record_visit(state, url, content_hash, when=None):
+    """Append a visit to the URL's history; returns True if the content changed"""
+    when = when or _now()
+    entry = state.setdefault(canonicalize_url(url), {
+        'url': url,
+        'visits': 0,
+        'changes': 0,
+        'observed_days': 0.0,
+        'history': [],
+    })
+
+    changed = False
+    if entry['history']:
+        last_visit, last_hash = entry['history'][-1]
+        entry['observed_days'] += max(0.0, (when - _parse(last_visit)).total_seconds() / 86400)
+        entry['visits'] += 1
+        if content_hash != last_hash:
+            entry['changes'] += 1
+            changed = True
+
+    entry['history'].append([when.isoformat(), content_hash])
+    del entry['history'][:-HISTORY_LIMIT]
+    entry['last_visit'] = when.isoformat()
+    return changed
+
+def change_rate(entry):
+    """
+    Estimated changes per day.
+
+    Poisson estimator for periodic visits (Cho & Garcia-Molina): with n
+    revisits over T days and X detected changes, rate = -ln((n - X + 0.5) / (n + 0.5)) * n / T,
+    which corrects for several changes between two visits being seen as one.
+    Blended with a prior so pages with little history are not starved.
+    """
+    n = entry.get('visits', 0)
+    days = entry.get('observed_days', 0.0)
+
+    if n == 0 or days <= 0:
+        return PRIOR_CHANGES_PER_DAY
+
+    x = min(entry.get('changes', 0), n)
+    observed = -math.log((n - x + 0.5) / (n + 0.5)) * n / days
+
+    return (observed * days + PRIOR_CHANGES_PER_DAY * PRIOR_WEIGHT_DAYS) / (days + PRIOR_WEIGHT_DAYS)
+
+def assign_intervals(state, daily_budget):
+    """
+    Set 'next_visit' for every page.
+
+    Visits per day are proportional to sqrt(rate) and scaled so the total
+    fits the daily budget. The interval is clamped to [MIN, MAX]_INTERVAL_DAYS
+    and never shorter than the page's expected time between changes / 2.
+    """
+    rates = {key: change_rate(entry) for key, entry in state.items()}
+    weights = {key: math.sqrt(rate) for key, rate in rates.items()}
+    total_weight = sum(weights.values()) or 1.0
+
+    for key, entry in state.items():
+        per_day = daily_budget * weights[key] / total_weight
+        interval = 1 / per_day if per_day > 0 else MAX_INTERVAL_DAYS
+        interval = max(interval, 0.5 / rates[key]) if rates[key] > 0 else MAX_INTERVAL_DAYS
+        interval = min(MAX_INTERVAL_DAYS, max(MIN_INTERVAL_DAYS, interval))
+
+        entry['change_rate'] = round(rates[key], 5)
+        entry['interval_days'] = round(interval, 3)
+        last = _parse(entry.get('last_visit'))
+        entry['next_visit'] = (last + timedelta(days=interval)).isoformat() if last else None
+
+def due_pages(state, daily_budget, now=None, extra_urls=()):
+    """
+    Pages worth fetching now, most likely changed first, within today's remaining budget.
+
+    extra_urls are URLs from a structure file; those never visited are always due.
+    """
+    now = now or _now()
+    assign_intervals(state, daily_budget)
+
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    used_today = sum(
+        1 for entry in state.values()
+        for visit, _ in entry['history']
+        if _parse(visit) >= day_start
+    )
+    remaining = max(0, daily_budget - used_today)
+
+    candidates = []
+    seen = set()
+
+    for url in extra_urls:
+        key = canonicalize_url(url)
+        if key not in state and key not in seen:
+            seen.add(key)
+            candidates.append((2.0, url))
+
+    for key, entry in state.items():
+        next_visit = _parse(entry.get('next_visit'))
+        if next_visit and next_visit > now:
+            continue
+        elapsed = (now - _parse(entry['last_visit'])).total_seconds() / 86400
+        probability = 1 - math.exp(-entry['change_rate'] * elapsed)
+        candidates.append((probability, entry['url']))
+
+    candidates.sort(key=lambda item: item[0], reverse=True)
+    return [(url, round(min(score, 1.0), 4)) for score, url in candidates[:remaining]]
+
+def state_stats(state):
+    rates = sorted(change_rate(entry) for entry in state.values())
+    return {
+        'pages': len(state),
+        'visits': sum(entry['visits'] for entry in state.values()),
+        'changes': sum(entry['changes'] for entry in state.values()),
+        'median_change_rate_per_day': round(rates[len(rates) // 2], 5) if rates else None,
+        'changing_daily_or_faster': sum(1 for r in rates if r >= 1),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Adaptive revisit scheduler')
+    parser.add_argument('command', choices=['due', 'stats'])
+    parser.add_argument('--state', default=DEFAULT_STATE_FILE)
+    parser.add_argument('--budget', type=int, default=500, help='Fetches per day across all pages')
+    parser.add_argument('--pages', help='Structure file (.json/.jsonl) to add never-visited pages')
+    parser.add_argument('--format', choices=['jsonl', 'urls'], default='jsonl')
+    args = parser.parse_args()
+
+    state = load_state(args.state)
+
+    if args.command == 'stats':
+        print(json.dumps(state_stats(state), indent=2, ensure_ascii=False))
+        sys.exit(0)
+
+    extra = []
+    if args.pages:
+        from crawl_io import load_structure_pages
+        extra = (page['url'] for page in load_structure_pages(args.pages) if page['url'].startswith('http'))
+
+    due = due_pages(state, args.budget, extra_urls=extra)
+    save_state(state, args.state)
+
+    for url, probability in due:
+        if args.format == 'urls':
+            print(url)
+        else:
+            print(json.dumps({'url': url, 'change_probability': probability}, ensure_ascii=False))
+
+    print(f"{len(due)} page(s) due", file=sys.stderr)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Long-running scrape service
+- Local HTTP API over the v2 extractor
+- Keeps the HTTP session pool, compiled rules and token pool warm
+- Bounded worker pool with a bounded queue
+- Batch submission with polling
+
+Endpoints:
+    POST /scrape        {"url": ...} or {"html": ..., "url": ...}, optional "format": "markdown"|"json"
+    POST /batch         {"urls": [...], "format": ...}  -> {"batch_id": ...}
+    GET  /batch/<id>    batch status and finished results
+    GET  /health        queue and quota stats
+"""
+
+import sys
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Import relative to this file, not the caller's working directory
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'scrapedo-web-scraper' / 'scripts'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from routing import FetchRouter
+from production_scraper_v2 import extract_structured_content, content_to_markdown, make_quota_manager
+from tilda_store import append_store_products
+
+MAX_BATCHES_KEPT = 100
+
+
+class ScrapeService:
+    """Warm scraping state shared by all HTTP requests"""
+
+    def __init__(self, workers=4, max_queue=200, credit_budget=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scrape')
+        self.quota = make_quota_manager(credit_budget, max_concurrency=workers)
+        self.router = FetchRouter()
+        self.batches = OrderedDict()
+        self.pending = 0
+        self.processed = 0
+        self.lock = threading.Lock()
+
+    def process(self, url=None, html=None, fmt='markdown'):
+        """Fetch (unless html is given), extract and render one page"""
+        started = time.monotonic()
+        timings = {}
+
+        if html is None:
+            result = self.router.fetch(url, quota=self.quota, with_text=False)
+            timings['fetch'] = round(time.monotonic() - started, 3)
+            timings['route'] = result.get('route')
+            if not result['success']:
+                return {'url': url, 'success': False, 'error': result['content'], 'timings': timings}
+            html = result['html']
+
+        extract_started = time.monotonic()
+        content_data = extract_structured_content(html, url or '')
+        if content_data['store_blocks']:
+            append_store_products(content_data)
+        timings['extract'] = round(time.monotonic() - extract_started, 3)
+
+        response = {'url': url, 'success': True, 'timings': timings}
+        if fmt == 'json':
+            response['content'] = content_data
+        else:
+            response['markdown'] = content_to_markdown(content_data)
+
+        return response
+
+    def _run(self, url, html, fmt):
+        try:
+            return self.process(url, html, fmt)
+        except Exception as e:
+            return {'url': url, 'success': False, 'error': f"Failed: {str(e)}"}
+        finally:
+            with self.lock:
+                self.pending -= 1
+                self.processed += 1
+
+    def submit(self, url=None, html=None, fmt='markdown'):
+        """Queue one page; returns a Future or None if the queue is full"""
+        with self.lock:
+            if self.pending >= self.max_queue:
+                return None
+            self.pending += 1
+        return self.executor.submit(self._run, url, html, fmt)
+
+    def submit_batch(self, urls, fmt='markdown'):
+        """Queue a batch; returns batch id or None if it does not fit the queue"""
+        with self.lock:
+            if self.pending + len(urls) > self.max_queue:
+                return None
+
+        batch_id = uuid.uuid4().hex[:12]
+        batch = {'total': len(urls), 'results': [], 'created': time.time()}
+
+        with self.lock:
+            self.batches[batch_id] = batch
+            while len(self.batches) > MAX_BATCHES_KEPT:
+                self.batches.popitem(last=False)
+
+        for url in urls:
+            future = self.submit(url=url, fmt=fmt)
+            if future is None:
+                batch['results'].append({'url': url, 'success': False, 'error': 'Queue full'})
+                continue
+            future.add_done_callback(lambda f, b=batch: b['results'].append(f.result()))
+
+        return batch_id
+
+    def batch_status(self, batch_id):
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+
+        done = len(batch['results'])
+        return {
+            'batch_id': batch_id,
+            'status': 'done' if done >= batch['total'] else 'running',
+            'done': done,
+            'total': batch['total'],
+            'results': list(batch['results']),
+        }
+
+    def health(self):
+        stats = {
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_queue': self.max_queue,
+            'processed': self.processed,
+            'batches': len(self.batches),
+        }
+        if self.quota:
+            stats['quota'] = self.quota.stats()
+        stats['routing'] = self.router.stats()
+        return stats
+
+
+def make_handler(service):
+    class ScrapeHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length', 0))
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length).decode('utf-8'))
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, service.health())
+            elif self.path.startswith('/batch/'):
+                status = service.batch_status(self.path[len('/batch/'):])
+                if status is None:
+                    self._send(404, {'error': 'Unknown batch'})
+                else:
+                    self._send(200, status)
+            else:
+                self._send(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            try:
+                payload = self._read_json()
+            except (ValueError, UnicodeDecodeError):
+                self._send(400, {'error': 'Invalid JSON'})
+                return
+
+            if not isinstance(payload, dict):
+                self._send(400, {'error': 'Expected a JSON object'})
+                return
+
+            fmt = payload.get('format', 'markdown')
+
+            if self.path == '/scrape':
+                if not payload.get('url') and not payload.get('html'):
+                    self._send(400, {'error': 'Expected "url" or "html"'})
+                    return
+                if not all(isinstance(payload.get(key) or '', str) for key in ('url', 'html')):
+                    self._send(400, {'error': '"url" and "html" must be strings'})
+                    return
+                future = service.submit(payload.get('url'), payload.get('html'), fmt)
+                if future is None:
+                    self._send(503, {'error': 'Queue full'})
+                    return
+                result = future.result()
+                self._send(200 if result['success'] else 502, result)
+
+            elif self.path == '/batch':
+                if not isinstance(payload.get('urls'), list):
+                    self._send(400, {'error': 'Expected "urls" list'})
+                    return
+                urls = [u for u in payload['urls'] if isinstance(u, str) and u.startswith('http')]
+                if not urls:
+                    self._send(400, {'error': 'Expected non-empty "urls"'})
+                    return
+                batch_id = service.submit_batch(urls, fmt)
+                if batch_id is None:
+                    self._send(503, {'error': 'Queue full'})
+                    return
+                self._send(202, {'batch_id': batch_id, 'total': len(urls)})
+
+            else:
+                self._send(404, {'error': 'Not found'})
+
+        def log_message(self, format, *args):
+            print(f"[service] {self.address_string()} {format % args}")
+
+    return ScrapeHandler
+
+
+def serve(host='127.0.0.1', port=8765, workers=4, max_queue=200, credit_budget=None):
+    """Run the service until interrupted"""
+    service = ScrapeService(workers=workers, max_queue=max_queue, credit_budget=credit_budget)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+
+    print(f"Scrape service listening on http://{host}:{port} ({workers} workers, queue {max_queue})")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        service.executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local HTTP scrape service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-queue', type=int, default=200)
+    parser.add_argument('--budget', type=int, default=None, help='Scrape.do credit budget for the service lifetime')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.max_queue, args.budget)
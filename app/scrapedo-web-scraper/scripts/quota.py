@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Менеджер квоты и конкурентности для Scrape.do API.
+
+- AIMD-регулировка числа одновременных запросов (уменьшение на 429)
+- Соблюдение Retry-After
+- Учет потраченных кредитов по сайтам и за запуск
+- Остановка до превышения бюджета
+- Round-robin по нескольким токенам
+"""
+
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class QuotaExceeded(Exception):
+    """Бюджет кредитов исчерпан — новые запросы не отправляются"""
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """
+    Разбирает заголовок Retry-After.
+
+    Args:
+        value: Значение заголовка (секунды или HTTP-дата)
+        default: Пауза, если заголовок отсутствует или не разобран
+
+    Returns:
+        Пауза в секундах
+    """
+    if not value:
+        return default
+
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class _TokenState:
+    """Состояние одного токена: лимит конкурентности, кулдаун, кредиты"""
+
+    def __init__(self, token: str, limit: float):
+        self.token = token
+        self.limit = limit
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.credits = 0
+        self.requests = 0
+        self.throttled = 0
+
+
+class QuotaManager:
+    """
+    Распределяет запросы к Scrape.do между токенами с учетом лимитов.
+
+    Лимит конкурентности каждого токена растет на ``increase_step`` после
+    успешного запроса и умножается на ``decrease_factor`` после 429
+    (AIMD). Все методы потокобезопасны.
+    """
+
+    def __init__(
+        self,
+        tokens: List[str],
+        max_concurrency: int = 5,
+        min_concurrency: int = 1,
+        initial_concurrency: Optional[int] = None,
+        budget: Optional[int] = None,
+        site_budget: Optional[int] = None,
+        increase_step: float = 0.25,
+        decrease_factor: float = 0.5,
+        max_retries: int = 3,
+    ):
+        """
+        Args:
+            tokens: Список токенов Scrape.do
+            max_concurrency: Верхний лимит одновременных запросов на токен
+            min_concurrency: Нижний лимит одновременных запросов на токен
+            initial_concurrency: Стартовый лимит (по умолчанию max_concurrency)
+            budget: Максимум кредитов за запуск (None — без ограничения)
+            site_budget: Максимум кредитов на один сайт (None — без ограничения)
+            increase_step: Аддитивный прирост лимита после успеха
+            decrease_factor: Мультипликативное уменьшение лимита после 429
+            max_retries: Сколько раз повторять запрос после 429
+        """
+        if not tokens:
+            raise ValueError('QuotaManager требует хотя бы один токен')
+
+        start = initial_concurrency if initial_concurrency is not None else max_concurrency
+        self._states = [_TokenState(t, float(start)) for t in dict.fromkeys(tokens)]
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.budget = budget
+        self.site_budget = site_budget
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+
+        self._cond = threading.Condition()
+        self._next = 0
+        self._run_credits = 0
+        self._reserved = 0
+        self._site_credits: Dict[str, int] = {}
+        self._site_reserved: Dict[str, int] = {}
+        self._site_cost: Dict[str, int] = {}
+        self._max_cost = 1
+        self._cost_seen = False
+        self._reservations: Dict[Tuple[str, Optional[str]], List[int]] = {}
+
+    def _estimate(self, site: Optional[str]) -> int:
+        """
+        Ожидаемая стоимость следующего запроса: максимум наблюдавшейся на
+        сайте (для нового сайта — по всем сайтам, до первого ответа — 1)
+        """
+        return self._site_cost.get(site, self._max_cost) if site else self._max_cost
+
+    def _check_budget(self, site: Optional[str], estimate: int) -> None:
+        if self.budget is not None and self._run_credits + self._reserved + estimate > self.budget:
+            raise QuotaExceeded(f'Бюджет запуска исчерпан ({self._run_credits}/{self.budget} кредитов)')
+
+        if site and self.site_budget is not None:
+            spent = self._site_credits.get(site, 0) + self._site_reserved.get(site, 0)
+            if spent + estimate > self.site_budget:
+                raise QuotaExceeded(f'Бюджет сайта {site} исчерпан ({spent}/{self.site_budget} кредитов)')
+
+    def _pick(self, now: float) -> Optional[_TokenState]:
+        count = len(self._states)
+        for offset in range(count):
+            state = self._states[(self._next + offset) % count]
+            if state.cooldown_until <= now and state.in_flight < int(state.limit):
+                self._next = (self._next + offset + 1) % count
+                return state
+        return None
+
+    def acquire(self, site: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """
+        Резервирует слот и возвращает токен для следующего запроса.
+
+        Под запрос резервируется ожидаемая стоимость (см. _estimate), чтобы
+        параллельные запросы с реальной стоимостью > 1 не вывели расход за
+        бюджет. При заданном бюджете, пока ни один ответ не сообщил
+        стоимость, в полете держится только один запрос.
+
+        Args:
+            site: Хост сайта для учета кредитов
+            timeout: Максимальное ожидание свободного слота (None — без ограничения)
+
+        Returns:
+            Токен Scrape.do
+
+        Raises:
+            QuotaExceeded: если запрос превысил бы бюджет
+            TimeoutError: если слот не освободился за timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            while True:
+                estimate = self._estimate(site)
+                self._check_budget(site, estimate)
+
+                now = time.time()
+                limited = self.budget is not None or self.site_budget is not None
+                state = None if limited and not self._cost_seen and self._reserved else self._pick(now)
+                if state is not None:
+                    state.in_flight += 1
+                    self._reserved += estimate
+                    self._reservations.setdefault((state.token, site), []).append(estimate)
+                    if site:
+                        self._site_reserved[site] = self._site_reserved.get(site, 0) + estimate
+                    return state.token
+
+                wait = None
+                cooldowns = [s.cooldown_until - now for s in self._states if s.cooldown_until > now]
+                if cooldowns:
+                    wait = min(cooldowns)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError('Нет свободного слота Scrape.do')
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def release(
+        self,
+        token: str,
+        site: Optional[str] = None,
+        cost: int = 1,
+        throttled: bool = False,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """
+        Освобождает слот после ответа API.
+
+        Args:
+            token: Токен, выданный acquire()
+            site: Хост сайта (тот же, что в acquire)
+            cost: Фактически списанные кредиты
+            throttled: Ответ был 429
+            retry_after: Пауза из Retry-After в секундах
+        """
+        with self._cond:
+            state = next(s for s in self._states if s.token == token)
+            state.in_flight = max(0, state.in_flight - 1)
+            state.requests += 1
+            state.credits += cost
+
+            reservations = self._reservations.get((token, site))
+            reserved = reservations.pop() if reservations else 1
+            self._reserved = max(0, self._reserved - reserved)
+            self._run_credits += cost
+            self._max_cost = max(self._max_cost, cost)
+            self._cost_seen = self._cost_seen or cost > 0
+            if site:
+                self._site_reserved[site] = max(0, self._site_reserved.get(site, 0) - reserved)
+                self._site_credits[site] = self._site_credits.get(site, 0) + cost
+                self._site_cost[site] = max(self._site_cost.get(site, 1), cost)
+
+            if throttled:
+                state.throttled += 1
+                state.limit = max(float(self.min_concurrency), state.limit * self.decrease_factor)
+                if retry_after:
+                    state.cooldown_until = max(state.cooldown_until, time.time() + retry_after)
+            else:
+                state.limit = min(float(self.max_concurrency), state.limit + self.increase_step)
+
+            self._cond.notify_all()
+
+    def remaining(self) -> Optional[int]:
+        """Остаток бюджета запуска в кредитах (None — без ограничения)"""
+        if self.budget is None:
+            return None
+        with self._cond:
+            return max(0, self.budget - self._run_credits - self._reserved)
+
+    def stats(self) -> dict:
+        """Сводка по кредитам и токенам для отчета"""
+        with self._cond:
+            return {
+                'credits_spent': self._run_credits,
+                'budget': self.budget,
+                'site_budget': self.site_budget,
+                'credits_by_site': dict(self._site_credits),
+                'tokens': [
+                    {
+                        'token': f'...{s.token[-4:]}',
+                        'requests': s.requests,
+                        'credits': s.credits,
+                        'throttled': s.throttled,
+                        'concurrency_limit': int(s.limit),
+                    }
+                    for s in self._states
+                ],
+            }
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Хвостовые задержки и недоступные хосты в слое запросов.
+
+- Hedged requests: дублирующий запрос, если ответ дольше наблюдаемого p95
+- Ограничение доли дублирующих запросов (лишних кредитов)
+- Circuit breaker по хосту: быстрый отказ после серии ошибок и пробный запрос
+  после паузы
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    from quota import QuotaExceeded
+except ImportError:
+    from .quota import QuotaExceeded
+
+
+class CircuitOpen(Exception):
+    """Хост временно отключен circuit breaker'ом — страницу стоит отложить"""
+
+
+class LatencyTracker:
+    """Скользящее окно задержек для оценки перцентилей"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Перцентиль задержки.
+
+        Args:
+            p: Перцентиль (0-100)
+
+        Returns:
+            Секунды или None, пока выборка меньше min_samples
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class _HostCircuit:
+    def __init__(self):
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker по хостам.
+
+    closed → open после failure_threshold ошибок подряд; через recovery_timeout
+    пропускается один пробный запрос (half_open): успех закрывает цепь,
+    ошибка снова открывает.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._hosts: Dict[str, _HostCircuit] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, host: str) -> _HostCircuit:
+        if host not in self._hosts:
+            self._hosts[host] = _HostCircuit()
+        return self._hosts[host]
+
+    def allow(self, host: str) -> bool:
+        """Можно ли сейчас отправить запрос к хосту"""
+        with self._lock:
+            circuit = self._get(host)
+            if circuit.state == 'closed':
+                return True
+            if circuit.state == 'open' and time.monotonic() - circuit.opened_at >= self.recovery_timeout:
+                circuit.state = 'half_open'
+                return True
+            return False
+
+    def retry_in(self, host: str) -> float:
+        """Секунд до следующего пробного запроса (0 — можно сейчас)"""
+        with self._lock:
+            circuit = self._get(host)
+            if circuit.state != 'open':
+                return 0.0
+            return max(0.0, circuit.opened_at + self.recovery_timeout - time.monotonic())
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            circuit = self._get(host)
+            circuit.state = 'closed'
+            circuit.failures = 0
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            circuit = self._get(host)
+            circuit.failures += 1
+            if circuit.state == 'half_open' or circuit.failures >= self.failure_threshold:
+                if circuit.state != 'open':
+                    circuit.trips += 1
+                circuit.state = 'open'
+                circuit.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                host: {'state': c.state, 'consecutive_failures': c.failures, 'trips': c.trips}
+                for host, c in self._hosts.items()
+                if c.trips or c.failures
+            }
+
+
+class FetchResilience:
+    """
+    Hedged requests + circuit breaker для fetch_via_scrapedo.
+
+    Дублирующий запрос отправляется, если первый не ответил за p95
+    наблюдаемой задержки, но не чаще чем для max_hedge_ratio запросов.
+    """
+
+    def __init__(
+        self,
+        max_hedge_ratio: float = 0.1,
+        hedge_percentile: float = 95,
+        min_hedge_delay: float = 1.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 60.0,
+        max_workers: int = 16,
+    ):
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self.max_hedge_ratio = max_hedge_ratio
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Через сколько секунд отправлять дубль (None — не отправлять)"""
+        p = self.latency.percentile(self.hedge_percentile)
+        if p is None:
+            return None
+        with self._lock:
+            if self.hedges + 1 > self.max_hedge_ratio * max(self.requests, 1):
+                return None
+        return max(self.min_hedge_delay, p)
+
+    def send(
+        self,
+        send: Callable,
+        token: str,
+        site: Optional[str] = None,
+        quota=None,
+        release_loser: Optional[Callable] = None,
+    ) -> Tuple[object, str]:
+        """
+        Выполняет запрос с возможным дублем.
+
+        Args:
+            send: Функция token -> response
+            token: Токен для основного запроса (уже получен из quota)
+            site: Хост сайта для quota
+            quota: QuotaManager — дубль берет слот и кредиты из него
+            release_loser: Функция (token, response|None) для освобождения
+                слота проигравшего запроса
+
+        Returns:
+            (response, token) — ответ победителя и его токен
+        """
+        with self._lock:
+            self.requests += 1
+
+        started = time.monotonic()
+        delay = self.hedge_delay()
+
+        if delay is None:
+            response = send(token)
+            self.latency.record(time.monotonic() - started)
+            return response, token
+
+        primary = self._executor.submit(send, token)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            self.latency.record(time.monotonic() - started)
+            return primary.result(), token
+
+        hedge_token = token
+        if quota is not None:
+            try:
+                hedge_token = quota.acquire(site, timeout=0)
+            except (QuotaExceeded, TimeoutError):
+                response = primary.result()
+                self.latency.record(time.monotonic() - started)
+                return response, token
+
+        with self._lock:
+            self.hedges += 1
+
+        hedge = self._executor.submit(send, hedge_token)
+        tokens = {primary: token, hedge: hedge_token}
+
+        winner = None
+        for future in as_completed(tokens):
+            if future.exception() is None:
+                winner = future
+                break
+
+        if winner is None:
+            if release_loser is not None and quota is not None:
+                release_loser(hedge_token, None)
+            raise primary.exception()
+
+        self.latency.record(time.monotonic() - started)
+        if winner is hedge:
+            with self._lock:
+                self.hedge_wins += 1
+
+        loser = primary if winner is hedge else hedge
+        if release_loser is not None and quota is not None:
+            loser_token = tokens[loser]
+            loser.add_done_callback(
+                lambda f: release_loser(loser_token, None if f.exception() else f.result())
+            )
+
+        return winner.result(), tokens[winner]
+
+    def stats(self) -> dict:
+        """Сводка для отчета"""
+        def rounded(p):
+            value = self.latency.percentile(p)
+            return round(value, 3) if value is not None else None
+
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'latency_p50': rounded(50),
+            'latency_p95': rounded(95),
+            'latency_p99': rounded(99),
+            'circuits': self.breaker.stats(),
+        }
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Адаптивная маршрутизация запросов: сначала прямой HTTP, Scrape.do — только при блокировке.
+
+- Прямой запрос через общий пул соединений
+- Детект блокировок: 403/429/503, страницы капчи/челленджа, пустые Tilda-оболочки
+- Запоминает по хосту, какой маршрут работает, и сразу идет нужным
+- Статистика задержек и успешности по маршрутам
+"""
+
+import re
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+try:
+    from scrape import fetch_via_scrapedo, extract_text_from_html, get_session
+except ImportError:
+    from .scrape import fetch_via_scrapedo, extract_text_from_html, get_session
+
+
+DIRECT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+BLOCK_STATUSES = {403, 429, 503}
+
+# Проверяются только на коротких ответах: страницы челленджей маленькие,
+# а в обычных страницах эти слова могут встречаться в скриптах форм
+CHALLENGE_RE = re.compile(
+    r'captcha|cf-chl-|challenge-platform|just a moment\.\.\.|ddos-guard|access denied|checking your browser',
+    re.I
+)
+CHALLENGE_MAX_SIZE = 30000
+MIN_HTML_SIZE = 512
+TILDA_RECORD_RE = re.compile(r'\bid=["\']rec\d+')
+
+
+def detect_block(status_code: int, html: str) -> Optional[str]:
+    """
+    Определяет, что прямой ответ — блокировка, а не страница.
+
+    Args:
+        status_code: HTTP-статус
+        html: Тело ответа
+
+    Returns:
+        Причина блокировки или None, если ответ пригоден
+    """
+    if status_code in BLOCK_STATUSES:
+        return f'HTTP {status_code}'
+
+    if len(html) < MIN_HTML_SIZE:
+        return 'empty response'
+
+    if len(html) < CHALLENGE_MAX_SIZE and CHALLENGE_RE.search(html):
+        return 'challenge page'
+
+    # Tilda-оболочка без блоков: контент дорисовывается скриптом
+    if 'allrecords' in html and not TILDA_RECORD_RE.search(html):
+        return 'empty Tilda shell'
+
+    return None
+
+
+class _RouteStats:
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.latency = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'success_rate': round(self.successes / self.attempts, 3) if self.attempts else None,
+            'avg_latency': round(self.latency / self.attempts, 3) if self.attempts else None,
+        }
+
+
+class FetchRouter:
+    """
+    Маршрутизатор перед fetch_via_scrapedo.
+
+    Хост переводится на Scrape.do после block_threshold блокировок прямого
+    маршрута без успехов; раз в reprobe_every страниц прямой маршрут
+    пробуется снова.
+    """
+
+    def __init__(self, direct_timeout: float = 15.0, block_threshold: int = 2, reprobe_every: int = 50):
+        self.direct_timeout = direct_timeout
+        self.block_threshold = block_threshold
+        self.reprobe_every = reprobe_every
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, dict] = {}
+        self._routes = {'direct': _RouteStats(), 'scrapedo': _RouteStats()}
+        self.blocks: Dict[str, int] = {}
+
+    def _host(self, host: str) -> dict:
+        if host not in self._hosts:
+            self._hosts[host] = {'route': 'direct', 'direct_blocks': 0, 'since_probe': 0}
+        return self._hosts[host]
+
+    def _choose(self, host: str) -> str:
+        with self._lock:
+            state = self._host(host)
+            if state['route'] == 'scrapedo':
+                state['since_probe'] += 1
+                if state['since_probe'] >= self.reprobe_every:
+                    state['since_probe'] = 0
+                    return 'direct'
+            return state['route']
+
+    def _record(self, route: str, host: str, ok: bool, latency: float, reason: Optional[str] = None) -> None:
+        with self._lock:
+            stats = self._routes[route]
+            stats.attempts += 1
+            stats.latency += latency
+            if ok:
+                stats.successes += 1
+
+            if route != 'direct':
+                return
+
+            state = self._host(host)
+            if ok:
+                state['route'] = 'direct'
+                state['direct_blocks'] = 0
+            else:
+                state['direct_blocks'] += 1
+                if reason:
+                    self.blocks[reason] = self.blocks.get(reason, 0) + 1
+                if state['direct_blocks'] >= self.block_threshold:
+                    state['route'] = 'scrapedo'
+
+    def fetch_direct(self, url: str, with_text: bool = True) -> dict:
+        """
+        Прямой запрос без прокси.
+
+        Returns:
+            Словарь как у fetch_via_scrapedo; при блокировке success=False
+            и blocked=<причина>
+        """
+        try:
+            response = get_session().get(url, timeout=self.direct_timeout, headers=DIRECT_HEADERS)
+        except Exception as e:
+            return {'success': False, 'content': f'Ошибка прямого запроса: {str(e)}', 'blocked': 'network error'}
+
+        html_content = response.text
+        reason = detect_block(response.status_code, html_content)
+        if reason:
+            return {'success': False, 'content': f'Ошибка: прямой запрос заблокирован ({reason})', 'blocked': reason}
+
+        if response.status_code >= 400:
+            return {
+                'success': False,
+                'content': f'Ошибка при запросе: HTTP {response.status_code}',
+                'status_code': response.status_code,
+            }
+
+        return {
+            'success': True,
+            'content': extract_text_from_html(html_content) if with_text else '',
+            'html': html_content,
+            'status_code': response.status_code,
+        }
+
+    def fetch(self, url: str, token: Optional[str] = None, quota=None, resilience=None,
+              with_text: bool = True) -> dict:
+        """
+        Скачивает страницу выгодным маршрутом.
+
+        Args:
+            url: URL страницы
+            token, quota, resilience, with_text: Передаются в fetch_via_scrapedo
+
+        Returns:
+            Словарь как у fetch_via_scrapedo плюс route: 'direct' | 'scrapedo'
+        """
+        host = urlparse(url).netloc
+
+        if self._choose(host) == 'direct':
+            started = time.monotonic()
+            result = self.fetch_direct(url, with_text)
+            blocked = result.get('blocked')
+            # 404 и подобные — настоящий ответ сайта, Scrape.do его не исправит
+            self._record('direct', host, not blocked, time.monotonic() - started, blocked)
+            if not blocked:
+                result['route'] = 'direct'
+                return result
+
+        started = time.monotonic()
+        result = fetch_via_scrapedo(url, token, quota=quota, resilience=resilience, with_text=with_text)
+        self._record('scrapedo', host, result['success'], time.monotonic() - started)
+        result['route'] = 'scrapedo'
+        return result
+
+    def stats(self) -> dict:
+        """Сводка для отчета"""
+        with self._lock:
+            return {
+                'routes': {name: stats.as_dict() for name, stats in self._routes.items()},
+                'direct_blocks': dict(self.blocks),
+                'hosts_via_scrapedo': sorted(h for h, s in self._hosts.items() if s['route'] == 'scrapedo'),
+            }
@@ -7,10 +7,61 @@ Web scraping через scrape.do API
 import os
 import sys
 import argparse
+import threading
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from bs4 import BeautifulSoup
-from typing import Optional
+from typing import List, Optional
 from pathlib import Path
+from urllib.parse import urlparse
+
+try:
+    from quota import QuotaManager, QuotaExceeded, parse_retry_after
+except ImportError:
+    from .quota import QuotaManager, QuotaExceeded, parse_retry_after
+
+
+# Базовый URL API (переопределяется через SCRAPEDO_API_URL, см. get_api_url)
+DEFAULT_API_URL = 'http://api.scrape.do'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = 32) -> requests.Session:
+    """
+    Возвращает общую HTTP-сессию с пулом соединений.
+
+    Сессия создается один раз на процесс, поэтому повторные запросы
+    переиспользуют TCP/TLS-соединения вместо открытия новых.
+
+    Args:
+        pool_size: Размер пула соединений (учитывается при первом вызове)
+
+    Returns:
+        requests.Session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_api_url() -> str:
+    """
+    Адрес Scrape.do API: переменная окружения SCRAPEDO_API_URL (например,
+    локальный тестовый сервер) или DEFAULT_API_URL. Читается при каждом
+    запросе, поэтому ее можно задать и после импорта модуля.
+    """
+    return os.environ.get('SCRAPEDO_API_URL') or DEFAULT_API_URL
 
 
 def get_token() -> Optional[str]:
@@ -58,6 +109,40 @@ def get_token() -> Optional[str]:
     return None
 
 
+def get_tokens() -> List[str]:
+    """
+    Получает все доступные токены Scrape.do для пула.
+
+    Источники (без дубликатов, в порядке приоритета):
+    1. Файл config/tokens.txt — по одному токену в строке
+    2. Переменная окружения SCRAPEDO_TOKENS — токены через запятую
+    3. Одиночный токен из get_token()
+
+    Returns:
+        Список токенов (может быть пустым)
+    """
+    script_dir = Path(__file__).parent.parent
+    tokens = []
+
+    tokens_file = script_dir / 'config' / 'tokens.txt'
+    if tokens_file.exists():
+        try:
+            for line in tokens_file.read_text().splitlines():
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    tokens.append(line)
+        except Exception:
+            pass
+
+    tokens.extend(t.strip() for t in os.environ.get('SCRAPEDO_TOKENS', '').split(',') if t.strip())
+
+    token = get_token()
+    if token:
+        tokens.append(token)
+
+    return list(dict.fromkeys(tokens))
+
+
 def extract_text_from_html(html: str) -> str:
     """
     Извлекает текстовое содержимое из HTML.
@@ -70,12 +155,16 @@ def extract_text_from_html(html: str) -> str:
     """
     soup = BeautifulSoup(html, 'html.parser')
     
-    # Удаляем скрипты и стили
-    for element in soup(['script', 'style', 'noscript']):
-        element.decompose()
-    
-    # Получаем текст
-    text = soup.get_text(separator='\n', strip=True)
+    try:
+        # Удаляем скрипты и стили
+        for element in soup(['script', 'style', 'noscript']):
+            element.decompose()
+        
+        # Получаем текст
+        text = soup.get_text(separator='\n', strip=True)
+    finally:
+        # Дерево полно циклических ссылок parent/child — разбираем сразу, не дожидаясь GC
+        soup.decompose()
     
     # Убираем избыточные пробелы и пустые строки
     lines = [line.strip() for line in text.splitlines()]
@@ -84,49 +173,118 @@ def extract_text_from_html(html: str) -> str:
     return '\n'.join(lines)
 
 
-def fetch_via_scrapedo(url: str, token: Optional[str] = None) -> dict:
+def _request_cost(response) -> int:
+    """Кредиты, списанные за запрос (заголовок Scrape.do-Request-Cost)"""
+    try:
+        return int(response.headers.get('Scrape.do-Request-Cost', 1))
+    except (TypeError, ValueError):
+        return 1
+
+
+def fetch_via_scrapedo(url: str, token: Optional[str] = None, quota=None, resilience=None,
+                       with_text: bool = True) -> dict:
     """
     Делает запрос к Scrape.do API для скрапинга сайта.
     
     Args:
         url: URL для скрапинга
         token: Токен Scrape.do (если не передан, берется автоматически)
+        quota: QuotaManager — если передан, токен и паузы выбирает он,
+            а ответы 429 повторяются с учетом Retry-After
+        resilience: FetchResilience — hedged-запросы при задержке дольше p95
+            и circuit breaker по хосту
+        with_text: Извлекать текст в content; False — content пустой, когда
+            вызывающему нужен только html (экономит разбор и память)
         
     Returns:
         Словарь с результатом:
         - success: bool - успешность операции
         - content: str - извлеченный контент или ошибка
         - html: str - оригинальный HTML (если успешно)
+        - status_code: int - HTTP-статус ответа (если успешно)
+        - quota_exceeded: bool - бюджет кредитов исчерпан (только при ошибке)
+        - circuit_open: bool - хост временно отключен circuit breaker'ом (только при ошибке)
     """
     # Получаем токен
-    if token is None:
+    if token is None and quota is None:
         token = get_token()
     
-    if not token:
+    if not token and quota is None:
         script_dir = Path(__file__).parent.parent
         return {
             'success': False,
             'content': f'Ошибка: Не найден токен Scrape.do. Создайте файл {script_dir}/config/token.txt с вашим токеном или установите переменную окружения SCRAPEDO_TOKEN'
         }
     
-    # Формируем запрос (requests сам кодирует параметры)
-    base_api = 'http://api.scrape.do'
-    params = {
-        'token': token,
-        'url': url
-    }
+    site = urlparse(url).netloc
+    attempts = 1 + (quota.max_retries if quota is not None else 0)
     
-    try:
-        # Делаем запрос
-        response = requests.get(
-            base_api,
-            params=params,
+    if resilience is not None and not resilience.breaker.allow(site):
+        return {
+            'success': False,
+            'content': f'Ошибка: {site} временно недоступен (circuit breaker), повтор через {resilience.breaker.retry_in(site):.0f} с',
+            'circuit_open': True
+        }
+    
+    def send(request_token):
+        # Формируем запрос (requests сам кодирует параметры)
+        return get_session().get(
+            get_api_url(),
+            params={
+                'token': request_token,
+                'url': url
+            },
             timeout=30,
             headers={
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9',
                 'Accept-Encoding': 'gzip, deflate',
             }
         )
+    
+    def release_loser(loser_token, loser_response):
+        cost = _request_cost(loser_response) if loser_response is not None else 0
+        quota.release(loser_token, site, cost=cost)
+    
+    try:
+        for attempt in range(attempts):
+            if quota is not None:
+                token = quota.acquire(site)
+            
+            try:
+                # Делаем запрос
+                if resilience is not None:
+                    response, token = resilience.send(send, token, site, quota, release_loser)
+                else:
+                    response = send(token)
+            except Exception:
+                if quota is not None:
+                    quota.release(token, site, cost=0)
+                if resilience is not None:
+                    resilience.breaker.record_failure(site)
+                raise
+            
+            if resilience is not None:
+                if response.status_code >= 500:
+                    resilience.breaker.record_failure(site)
+                else:
+                    resilience.breaker.record_success(site)
+            
+            if response.status_code == 429:
+                if quota is not None:
+                    quota.release(
+                        token, site, cost=0, throttled=True,
+                        retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                    )
+                    if attempt + 1 < attempts:
+                        continue
+                return {
+                    'success': False,
+                    'content': 'Ошибка: Превышен лимит запросов Scrape.do'
+                }
+            
+            if quota is not None:
+                quota.release(token, site, cost=_request_cost(response))
+            break
         
         # Обрабатываем ошибки API
         if response.status_code == 401:
@@ -135,12 +293,6 @@ def fetch_via_scrapedo(url: str, token: Optional[str] = None) -> dict:
                 'content': 'Ошибка: Неверный токен Scrape.do или сервис заблокирован'
             }
         
-        if response.status_code == 429:
-            return {
-                'success': False,
-                'content': 'Ошибка: Превышен лимит запросов Scrape.do'
-            }
-        
         # Проверяем статус
         response.raise_for_status()
         
@@ -148,14 +300,21 @@ def fetch_via_scrapedo(url: str, token: Optional[str] = None) -> dict:
         html_content = response.text
         
         # Извлекаем текст
-        text_content = extract_text_from_html(html_content)
+        text_content = extract_text_from_html(html_content) if with_text else ''
         
         return {
             'success': True,
             'content': text_content,
-            'html': html_content
+            'html': html_content,
+            'status_code': response.status_code
         }
         
+    except QuotaExceeded as e:
+        return {
+            'success': False,
+            'content': f'Ошибка: {str(e)}',
+            'quota_exceeded': True
+        }
     except requests.exceptions.Timeout:
         return {
             'success': False,
@@ -173,12 +332,111 @@ def fetch_via_scrapedo(url: str, token: Optional[str] = None) -> dict:
         }
 
 
+def iter_batch_urls(source: str):
+    """
+    Читает URL для пакетного режима: по одному в строке, пустые строки и # пропускаются.
+
+    Args:
+        source: Путь к файлу или '-' для stdin
+    """
+    stream = sys.stdin if source == '-' else open(source, 'r', encoding='utf-8')
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def run_batch(
+    source: str,
+    workers: int = 8,
+    as_html: bool = False,
+    token: Optional[str] = None,
+    retry_file: Optional[str] = None,
+) -> int:
+    """
+    Пакетный режим: параллельно скачивает URL и печатает по одной NDJSON-записи
+    на URL по мере готовности.
+
+    Args:
+        source: Путь к файлу со списком URL или '-' для stdin
+        workers: Число параллельных запросов
+        as_html: Выводить HTML вместо текста
+        token: Токен Scrape.do (по умолчанию — пул из get_tokens())
+        retry_file: Куда записать URL, которые не удалось скачать
+
+    Returns:
+        Число неудачных URL
+    """
+    tokens = [token] if token else get_tokens()
+    quota = QuotaManager(tokens, max_concurrency=workers) if tokens else None
+    get_session(pool_size=workers)
+    
+    def fetch_one(url):
+        started = time.monotonic()
+        result = fetch_via_scrapedo(url, token, quota=quota)
+        record = {
+            'url': url,
+            'status': 'ok' if result['success'] else 'error',
+            'http_status': result.get('status_code'),
+            'timings': {'total': round(time.monotonic() - started, 3)},
+        }
+        if not result['success']:
+            record['error'] = result['content']
+        elif as_html:
+            record['html'] = result['html']
+        else:
+            record['text'] = result['content']
+        return record
+    
+    failed = 0
+    retry = open(retry_file, 'w', encoding='utf-8') if retry_file else None
+    emit_lock = threading.Lock()
+    # Держим в работе не больше 2*workers URL, чтобы не читать весь список в память
+    slots = threading.BoundedSemaphore(workers * 2)
+    
+    def emit(url, future):
+        """Печатает запись сразу по готовности (в потоке, завершившем запрос)"""
+        nonlocal failed
+        try:
+            record = future.result()
+        except Exception as e:
+            record = {'url': url, 'status': 'error', 'error': f'Неожиданная ошибка: {str(e)}'}
+        
+        try:
+            with emit_lock:
+                sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+                sys.stdout.flush()
+                if record['status'] != 'ok':
+                    failed += 1
+                    if retry:
+                        retry.write(record['url'] + '\n')
+                        retry.flush()
+        finally:
+            slots.release()
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for url in iter_batch_urls(source):
+                slots.acquire()
+                future = executor.submit(fetch_one, url)
+                future.add_done_callback(lambda f, url=url: emit(url, f))
+    finally:
+        if retry:
+            retry.close()
+    
+    return failed
+
+
 def main():
     """CLI интерфейс для скрипта"""
     parser = argparse.ArgumentParser(
         description='Скрапинг веб-страниц через Scrape.do API'
     )
-    parser.add_argument('url', help='URL для скрапинга')
+    parser.add_argument('url', nargs='?', help='URL для скрапинга')
     parser.add_argument(
         '--html',
         action='store_true',
@@ -188,9 +446,33 @@ def main():
         '--token',
         help='Токен Scrape.do (по умолчанию из GLOBAL_SYSTEM_SCRAPEDO_TOKEN)'
     )
+    parser.add_argument(
+        '--batch',
+        nargs='?',
+        const='-',
+        metavar='FILE',
+        help='Пакетный режим: URL из файла (или stdin без аргумента), вывод NDJSON'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help='Число параллельных запросов в пакетном режиме (по умолчанию 8)'
+    )
+    parser.add_argument(
+        '--retry-file',
+        help='Файл для URL, которые не удалось скачать в пакетном режиме'
+    )
     
     args = parser.parse_args()
     
+    if args.batch:
+        failed = run_batch(args.batch, args.workers, args.html, args.token, args.retry_file)
+        sys.exit(1 if failed else 0)
+    
+    if not args.url:
+        parser.error('нужен url или --batch')
+    
     # Выполняем скрапинг
     result = fetch_via_scrapedo(args.url, args.token)
     
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Sitemap-driven change detection
+- Reads sitemap.xml and nested sitemap indexes
+- Compares <lastmod> with the last successful fetch per URL
+- Schedules only new or changed pages, changed pages first
+"""
+
+import gzip
+import json
+import xml.etree.ElementTree as ET
+from datetime import datetime, time, timezone
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from scrape import fetch_via_scrapedo
+from crawl_dedup import canonicalize_url
+
+MAX_SITEMAP_DEPTH = 3
+
+
+def url_key(url):
+    """Key for matching structure URLs against sitemap URLs"""
+    return canonicalize_url(url)
+
+def parse_lastmod(value):
+    """
+    Parse a W3C datetime (date-only or full) into an aware UTC datetime.
+
+    A date-only value is taken as the end of that day: the page may have
+    changed at any time on it, including after a fetch earlier that day.
+    """
+    if not value:
+        return None
+
+    value = value.strip().replace('Z', '+00:00')
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+    if 'T' not in value and ' ' not in value:
+        parsed = datetime.combine(parsed.date(), time.max)
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed.astimezone(timezone.utc)
+
+def _fetch_sitemap_bytes(url, quota=None):
+    """Fetch sitemap directly, falling back to Scrape.do (credits counted by quota)"""
+    try:
+        response = requests.get(url, timeout=30)
+        if response.status_code == 200:
+            return response.content
+    except requests.exceptions.RequestException:
+        pass
+
+    result = fetch_via_scrapedo(url, quota=quota, with_text=False)
+    if result['success']:
+        return result['html'].encode('utf-8')
+
+    return None
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def fetch_sitemap_entries(sitemap_url, fetch=None, quota=None, _depth=0):
+    """
+    Return {url_key: lastmod} for every page in the sitemap, following sitemap indexes.
+
+    fetch (url -> bytes or None) defaults to a direct fetch with Scrape.do
+    as fallback, charged to quota (the run's QuotaManager).
+    """
+    if fetch is None:
+        fetch = lambda url: _fetch_sitemap_bytes(url, quota)
+
+    entries = {}
+
+    data = fetch(sitemap_url)
+    if not data:
+        print(f"  ✗ Sitemap unavailable: {sitemap_url}")
+        return entries
+
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        print(f"  ✗ Sitemap parse error {sitemap_url}: {e}")
+        return entries
+
+    is_index = _local_name(root.tag) == 'sitemapindex'
+
+    for node in root:
+        fields = {_local_name(child.tag): (child.text or '').strip() for child in node}
+        loc = fields.get('loc')
+        if not loc:
+            continue
+
+        if is_index:
+            if _depth < MAX_SITEMAP_DEPTH:
+                entries.update(fetch_sitemap_entries(loc, fetch, quota, _depth + 1))
+        else:
+            entries[url_key(loc)] = parse_lastmod(fields.get('lastmod'))
+
+    return entries
+
+def default_sitemap_url(pages):
+    """Guess <origin>/sitemap.xml from the first HTTP page"""
+    for page in pages:
+        parsed = urlparse(page['url'])
+        if parsed.scheme in ('http', 'https'):
+            return f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"
+    return None
+
+def load_fetch_state(state_file):
+    """Load {url_key: {'last_fetched': iso}}"""
+    path = Path(state_file)
+    if not path.exists():
+        return {}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_fetch_state(state, state_file):
+    path = Path(state_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    tmp.replace(path)
+
+def record_fetch(state, url, when=None):
+    """Remember a successful fetch of url"""
+    when = when or datetime.now(timezone.utc)
+    state[url_key(url)] = {'last_fetched': when.isoformat()}
+
+def plan_pages(pages, sitemap_entries, state, include_sitemap_only=True):
+    """
+    Split pages into a fetch plan.
+
+    Returns (scheduled_pages, stats). Order: changed (newest lastmod first),
+    new, then pages without a usable lastmod. Unchanged pages are skipped.
+    """
+    changed = []
+    new = []
+    unknown = []
+    skipped = 0
+    seen = set()
+
+    def classify(page):
+        nonlocal skipped
+        key = url_key(page['url'])
+        if key in seen:
+            return
+        seen.add(key)
+
+        lastmod = sitemap_entries.get(key)
+        fetched = state.get(key, {}).get('last_fetched')
+
+        if not fetched:
+            new.append(page)
+        elif lastmod is None:
+            unknown.append(page)
+        elif lastmod > parse_lastmod(fetched):
+            changed.append((lastmod, page))
+        else:
+            skipped += 1
+
+    for page in pages:
+        classify(page)
+
+    if include_sitemap_only:
+        for key in sitemap_entries:
+            if key not in seen:
+                classify({'url': key, 'source': 'sitemap'})
+
+    changed.sort(key=lambda item: item[0], reverse=True)
+    scheduled = [page for _, page in changed] + new + unknown
+
+    stats = {
+        'sitemap_urls': len(sitemap_entries),
+        'changed': len(changed),
+        'new': len(new),
+        'no_lastmod': len(unknown),
+        'skipped_unchanged': skipped,
+        'scheduled': len(scheduled),
+    }
+
+    return scheduled, stats
@@ -0,0 +1,103 @@
+"""
+<link rel="canonical"> handling in rescrape_all_pages
+- an alias is skipped once its declared page is written, in any crawl order
+- an alias whose declared page is never written (failed, missing, cycle) is kept
+
+Run from app/: python -m pytest -q tests
+"""
+
+import json
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR / 'scrapedo-web-scraper' / 'scripts'))
+sys.path.insert(0, str(APP_DIR))
+
+import pytest
+
+from production_scraper_v2 import rescrape_all_pages
+
+HOST = 'https://example.com'
+
+
+def page(name, canonical=None):
+    link = f'<link rel="canonical" href="{HOST}/{canonical}">' if canonical else ''
+    return (f'<html><head><title>{name.upper()}</title>{link}</head>'
+            f'<body><p>Body text of page {name}, long enough to keep</p></body></html>')
+
+def crawl(tmp_path, site, order, parse_workers):
+    """Run rescrape_all_pages over site ({name: html}) and return (written files, {name: log record})"""
+    def fetch(url):
+        html = site.get(url[len(HOST) + 1:])
+        if html is None:
+            return {'success': False, 'content': f"Not found: {url}"}
+        return {'success': True, 'content': '', 'html': html}
+
+    output = tmp_path / 'out'
+    summary_file = tmp_path / 'summary.json'
+    rescrape_all_pages(
+        [{'url': f"{HOST}/{name}"} for name in order],
+        output,
+        summary_file=summary_file,
+        state_file=None,
+        revisit_state_file=None,
+        fetch=fetch,
+        direct_first=False,
+        fetch_workers=2,
+        parse_workers=parse_workers,
+        request_delay=0,
+    )
+
+    with open(summary_file.with_suffix('.jsonl'), encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    log = {record['url'][len(HOST) + 1:]: record for record in records if 'url' in record}
+    return sorted(path.name for path in output.iterdir()), log
+
+
+@pytest.fixture(params=[0, 2], ids=['sequential', 'pipelined'])
+def parse_workers(request):
+    return request.param
+
+
+@pytest.mark.parametrize('order', [['x', 'y'], ['y', 'x']])
+def test_alias_is_skipped_when_declared_page_is_written(tmp_path, parse_workers, order):
+    site = {'x': page('x', canonical='y'), 'y': page('y')}
+
+    files, log = crawl(tmp_path, site, order, parse_workers)
+
+    assert files == ['y.md']
+    assert log['x']['status'] == 'skipped'
+    assert log['x']['reason'] == 'canonical link'
+    assert log['y']['status'] == 'ok'
+
+def test_declared_page_missing_from_list_is_fetched(tmp_path, parse_workers):
+    site = {'x': page('x', canonical='y'), 'y': page('y')}
+
+    files, log = crawl(tmp_path, site, ['x'], parse_workers)
+
+    assert files == ['y.md']
+    assert log['x']['reason'] == 'canonical link'
+
+@pytest.mark.parametrize('order', [['x', 'y'], ['y', 'x'], ['x']])
+def test_alias_is_kept_when_declared_page_fails(tmp_path, parse_workers, order):
+    site = {'x': page('x', canonical='y')}
+
+    files, log = crawl(tmp_path, site, order, parse_workers)
+
+    assert files == ['x.md']
+    assert log['x']['status'] == 'ok'
+    assert log['x']['declared_canonical'] == f"{HOST}/y"
+    assert 'canonical_cycle' not in log['x']
+    assert log['y']['status'] == 'error'
+
+def test_canonical_cycle_keeps_both_pages(tmp_path, parse_workers):
+    site = {'b': page('b', canonical='c'), 'c': page('c', canonical='b')}
+
+    files, log = crawl(tmp_path, site, ['b', 'c'], parse_workers)
+
+    assert files == ['b.md', 'c.md']
+    for name, declared in (('b', 'c'), ('c', 'b')):
+        assert log[name]['status'] == 'ok'
+        assert log[name]['declared_canonical'] == f"{HOST}/{declared}"
+        assert log[name]['canonical_cycle'] is True
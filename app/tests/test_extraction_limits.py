@@ -0,0 +1,288 @@
+"""
+extract_structured_content worst-case guards (EXTRACTION_LIMITS)
+- each limit falls back to the text sweep and reports why in 'fallback'
+- adversarial pages (deep nesting, very wide zero-block pages) stay fast
+- on ordinary pages the output matches the pre-limits extractor
+
+Run from app/: python -m pytest -q tests
+"""
+
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urljoin
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR / 'scrapedo-web-scraper' / 'scripts'))
+sys.path.insert(0, str(APP_DIR))
+
+import pytest
+from bs4 import BeautifulSoup
+
+from production_scraper_v2 import (
+    CHROME_CLASS_RE,
+    EXTRACTION_LIMITS,
+    TILDA_COMPONENT_RE,
+    clean_text,
+    extract_accordion_content,
+    extract_structured_content,
+    is_tech_noise,
+)
+from tilda_store import find_store_blocks
+
+URL = 'https://example.com/page'
+
+
+def nested_page(depth):
+    return ('<html><body><div class="t396">' + '<div class="tn-elem">' * depth +
+            'deep text content here ok' + '</div>' * depth + '</div></body></html>')
+
+def wide_page(width):
+    return ('<html><body><div class="t396">' +
+            ''.join(f'<div class="tn-elem"><div class="tn-atom"><span>Element number {i} text long</span></div></div>'
+                    for i in range(width)) +
+            '</div></body></html>')
+
+def texts(content_data):
+    return [item['text'] for item in content_data['content']]
+
+
+# Limits and fallback reasons
+
+def test_deep_nesting_falls_back_to_text_sweep():
+    data = extract_structured_content(nested_page(EXTRACTION_LIMITS['max_depth'] + 50), URL)
+
+    assert data['fallback'] == {'reason': f"depth > {EXTRACTION_LIMITS['max_depth']}", 'strategy': 'text_sweep'}
+    assert texts(data) == ['deep text content here ok']
+    assert all(item['position'] is None for item in data['content'])
+
+def test_nesting_under_the_limit_uses_full_strategy():
+    data = extract_structured_content(nested_page(EXTRACTION_LIMITS['max_depth'] - 10), URL)
+
+    assert data['fallback'] is None
+    assert texts(data) == ['deep text content here ok']
+
+def test_node_count_falls_back_to_text_sweep():
+    data = extract_structured_content(wide_page(100), URL, limits={'max_nodes': 50})
+
+    assert data['fallback']['strategy'] == 'text_sweep'
+    assert re.fullmatch(r'\d+ nodes > 50', data['fallback']['reason'])
+    assert len(data['content']) == 100
+
+def test_cpu_time_budget_falls_back_to_text_sweep():
+    data = extract_structured_content(wide_page(300), URL, limits={'cpu_time_budget': 0.0})
+
+    assert data['fallback'] == {'reason': 'cpu time > 0.0s', 'strategy': 'text_sweep'}
+    assert len(data['content']) == 300
+
+def test_oversized_input_is_truncated():
+    html = '<html><body><p>First paragraph of the page</p>' + ' ' * 2000 + '<p>Paragraph after the limit</p></body></html>'
+    data = extract_structured_content(html, URL, limits={'max_input_chars': 1000})
+
+    assert data['fallback'] == {'reason': 'input > 1000 chars', 'strategy': 'truncated'}
+    assert texts(data) == ['First paragraph of the page']
+
+def test_truncation_and_sweep_reasons_are_combined():
+    html = nested_page(400)
+    data = extract_structured_content(html + ' ' * 100, URL, limits={'max_input_chars': len(html)})
+
+    assert data['fallback'] == {
+        'reason': f"input > {len(html)} chars; depth > {EXTRACTION_LIMITS['max_depth']}",
+        'strategy': 'text_sweep',
+    }
+
+
+# Adversarial pages
+
+@pytest.mark.parametrize('depth', [1000, 5000])
+def test_deeply_nested_page_is_fast(depth):
+    html = nested_page(depth)
+
+    started = time.process_time()
+    data = extract_structured_content(html, URL)
+    elapsed = time.process_time() - started
+
+    assert data['fallback']['strategy'] == 'text_sweep'
+    assert texts(data) == ['deep text content here ok']
+    assert elapsed < 5
+
+@pytest.mark.parametrize('width', [2000, 8000])
+def test_wide_zero_block_page_is_fast(width):
+    html = wide_page(width)
+
+    started = time.process_time()
+    data = extract_structured_content(html, URL)
+    elapsed = time.process_time() - started
+
+    assert data['fallback'] is None
+    assert len(data['content']) == width
+    assert elapsed < 5
+
+
+# Same output as the pre-limits extractor
+
+TILDA_TEXT_CLASSES = ['tn-atom', 't-descr', 't491__content', 't-card__descr', 't-text', 't-section__descr']
+BLOCK_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol']
+
+def reference_extract(html, url):
+    """extract_structured_content before EXTRACTION_LIMITS (per-element find()/find_all())"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title = soup.find('title')
+    title_text = clean_text(title.text) if title else "Untitled"
+
+    meta_desc = soup.find('meta', attrs={'name': 'description'})
+    description = clean_text(meta_desc.get('content', '')) if meta_desc else ""
+
+    canonical_link = soup.find('link', rel='canonical')
+    canonical = urljoin(url, canonical_link.get('href', '')) if canonical_link and canonical_link.get('href') else None
+
+    store_blocks = find_store_blocks(soup)
+
+    for element in soup(['script', 'style', 'noscript', 'svg', 'iframe', 'nav']):
+        element.decompose()
+
+    for element in soup.find_all(['header', 'footer']):
+        element.decompose()
+
+    for element in soup.find_all(class_=CHROME_CLASS_RE):
+        if not any(TILDA_COMPONENT_RE.match(cls) for cls in element.get('class', [])):
+            element.decompose()
+
+    is_tilda = soup.find('div', class_=lambda x: x and ('t396' in x or any('tn-' in cls for cls in x)))
+
+    if is_tilda:
+        main_content = soup.body or soup
+    else:
+        main_content = (
+            soup.find('main') or
+            soup.find('article') or
+            soup.find('div', id=re.compile(r'^content', re.I)) or
+            soup.body or
+            soup
+        )
+
+    content_structure = []
+    seen_texts = set()
+
+    def add_content(content_type, text, level=None):
+        text = clean_text(text)
+        if is_tech_noise(text):
+            return
+        if content_type != 'heading' and content_type != 'accordion_title' and len(text) < 10:
+            return
+        normalized = re.sub(r'\s+', ' ', text.lower()).strip()
+        if normalized in seen_texts:
+            return
+        seen_texts.add(normalized)
+        content_structure.append({'type': content_type, 'text': text, 'level': level})
+
+    for item in extract_accordion_content(main_content):
+        add_content(item['type'], item['text'])
+
+    for element in main_content.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+        add_content('heading', element.get_text(), int(element.name[1]))
+
+    for element in main_content.find_all('p'):
+        add_content('paragraph', element.get_text())
+
+    for element in main_content.find_all('li'):
+        if not element.find_parent('li'):
+            add_content('list_item', element.get_text())
+
+    for class_name in TILDA_TEXT_CLASSES:
+        for element in main_content.find_all('div', class_=lambda x: x and class_name in x):
+            if element.find(BLOCK_TAGS):
+                continue
+            text = element.get_text(separator=' ', strip=True)
+            if text and len(text) > 15:
+                add_content('paragraph', text)
+
+    for element in main_content.find_all('div'):
+        if any(tc in ' '.join(element.get('class', [])) for tc in TILDA_TEXT_CLASSES):
+            continue
+        if element.find(BLOCK_TAGS):
+            continue
+        if len(element.find_all('div')) > 1:
+            continue
+        text = element.get_text(separator=' ', strip=True)
+        if text and len(text) > 15:
+            add_content('paragraph', text)
+
+    return {
+        'title': title_text,
+        'url': url,
+        'description': description,
+        'canonical': canonical,
+        'content': content_structure,
+        'store_blocks': store_blocks,
+    }
+
+WORDS = ('акустика', 'трассировка', 'сервис', 'utrace', 'доставка', 'монтаж', 'quality', 'price',
+         'система', 'отзывы', 'гарантия', 'проект', 'контакты', 'catalog', 'решение', 'команда')
+DIV_CLASSES = ('t396', 'tn-elem', 'tn-atom', 't-descr t-descr_xs', 't491__content', 't-card__descr',
+               't-text', 't-section__descr', 't-container', 't-col t-col_6', 't585__header')
+CHROME_CLASSES = ('menu', 'footer-links')
+
+def random_text(rng, words=None):
+    return ' '.join(rng.choice(WORDS) for _ in range(words or rng.randint(1, 9)))
+
+def random_block(rng, depth):
+    """A random fragment built from Tilda-like markup"""
+    kind = rng.choice(('div', 'div', 'div', 'p', 'heading', 'list', 'accordion', 'chrome', 'text', 'noise', 'script')
+                      if depth < 6 else ('p', 'heading', 'text', 'noise'))
+
+    if kind == 'div':
+        attrs = f' class="{rng.choice(DIV_CLASSES)}"' if rng.random() < 0.8 else ''
+        if rng.random() < 0.2:
+            attrs += f' id="rec{rng.randint(1000, 9999)}" data-record-type="{rng.randint(1, 999)}"'
+        children = ''.join(random_block(rng, depth + 1) for _ in range(rng.randint(0, 4)))
+        return f'<div{attrs}>{children}</div>'
+    if kind == 'p':
+        return f'<p>{random_text(rng)}<br>{random_text(rng)}</p>'
+    if kind == 'heading':
+        level = rng.randint(1, 6)
+        return f'<h{level}>{random_text(rng, rng.randint(1, 4))}</h{level}>'
+    if kind == 'list':
+        items = ''.join(
+            f'<li>{random_text(rng)}' + (f'<ul><li>{random_text(rng)}</li></ul>' if rng.random() < 0.3 else '') + '</li>'
+            for _ in range(rng.randint(1, 4))
+        )
+        return f'<ul>{items}</ul>'
+    if kind == 'accordion':
+        return ('<div class="t585__accordion" data-accordion="true">'
+                f'<div class="t585__title">{random_text(rng, 3)}</div>'
+                f'<div class="t585__content"><div class="t585__text">{random_text(rng, 12)}</div></div></div>')
+    if kind == 'chrome':
+        # Leaf only: a chrome div nested in another one breaks on decompose, before and after the limits
+        return f'<div class="{rng.choice(CHROME_CLASSES)}"><a>{random_text(rng)}</a></div>'
+    if kind == 'text':
+        return f'<span>{random_text(rng)}</span>'
+    if kind == 'noise':
+        return rng.choice(('<span>nominify begin</span>', '<span>12 345</span>', '<span>ok</span>'))
+    return '<script>var t = {"lid": 1};</script>'
+
+def random_page(seed):
+    rng = random.Random(seed)
+    body = ''.join(random_block(rng, 0) for _ in range(rng.randint(3, 12)))
+    chrome = '<header><a>Menu</a></header>' if rng.random() < 0.5 else ''
+    return (f'<html><head><title>{random_text(rng, 3)}</title>'
+            f'<meta name="description" content="{random_text(rng)}">'
+            f'<link rel="canonical" href="/page-{seed}"></head>'
+            f'<body>{chrome}{body}<footer>footer text that is long enough</footer></body></html>')
+
+@pytest.mark.parametrize('seed', range(60))
+def test_output_matches_reference_extractor(seed):
+    html = random_page(seed)
+    expected = reference_extract(html, URL)
+    data = extract_structured_content(html, URL)
+
+    assert data['fallback'] is None
+    assert [{key: item[key] for key in ('type', 'text', 'level')} for item in data['content']] == expected['content']
+    for key in ('title', 'url', 'description', 'canonical'):
+        assert data[key] == expected[key]
+    # The extractor adds each block's document position
+    assert [{key: block[key] for key in ('storepart_uid', 'recid', 'record_type')}
+            for block in data['store_blocks']] == expected['store_blocks']
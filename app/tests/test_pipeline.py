@@ -0,0 +1,77 @@
+"""
+Pipeline write stage (_drain)
+- parsed pages are written when their parse finishes, not in fetch order
+- fetch failures are written while a slow parse is still running
+- parse errors are written as errors
+
+Run from app/: python -m pytest -q tests
+"""
+
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR / 'scrapedo-web-scraper' / 'scripts'))
+sys.path.insert(0, str(APP_DIR))
+
+from pipeline import Pipeline, _STOP
+
+
+def parse_future(url=None, error=None):
+    future = Future()
+    if url:
+        future.set_result((({'url': url}, f"# {url}"), 50.0))
+    elif error:
+        future.set_exception(error)
+    return future
+
+def drain(entries, fetch_workers=1):
+    """Run the write stage over outbox entries; returns [(url, parsed markdown or None, error)] in write order"""
+    written = []
+    pipeline = Pipeline(
+        fetch=None,
+        write=lambda item, result, parsed, error: written.append((item[0], parsed and parsed[1], error)),
+        fetch_workers=fetch_workers,
+        parse_workers=1,
+    )
+    outbox = queue.Queue()
+    for entry in entries:
+        outbox.put(entry)
+
+    pipeline._drain(outbox, [0], {})
+    return written, pipeline
+
+
+def test_slow_parse_does_not_hold_back_later_pages():
+    slow = Future()
+    entries = [
+        (('slow',), {'success': True}, slow),
+        (('fast',), {'success': True}, parse_future('fast')),
+        (('failed',), {'success': False, 'content': 'Failed: 404'}, None),
+        _STOP,
+    ]
+    threading.Timer(0.3, slow.set_result, args=((({'url': 'slow'}, '# slow'), 80.0),)).start()
+
+    written, pipeline = drain(entries)
+
+    assert written == [('fast', '# fast', None), ('failed', None, None), ('slow', '# slow', None)]
+    assert pipeline.worker_peak_rss_mb == 80.0
+
+def test_pending_parses_are_written_after_fetch_workers_stop():
+    slow = Future()
+    entries = [_STOP, (('a',), {'success': True}, slow), _STOP]
+    threading.Timer(0.2, slow.set_result, args=((({'url': 'a'}, '# a'), 10.0),)).start()
+
+    written, _ = drain(entries, fetch_workers=2)
+
+    assert written == [('a', '# a', None)]
+
+def test_parse_error_is_written_as_error():
+    entries = [(('bad',), {'success': True}, parse_future(error=ValueError('broken html'))), _STOP]
+
+    written, _ = drain(entries)
+
+    assert written == [('bad', None, 'Failed: broken html')]
@@ -0,0 +1,137 @@
+"""
+QuotaManager against a local fake Scrape.do server (SCRAPEDO_API_URL)
+- AIMD: concurrency limit halved on 429, grows back after successes
+- Retry-After cooldown before the retry
+- budget holds with Scrape.do-Request-Cost > 1 under concurrency
+- round-robin across tokens
+
+Run from app/: python -m pytest -q tests
+"""
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR / 'scrapedo-web-scraper' / 'scripts'))
+sys.path.insert(0, str(APP_DIR))
+
+import pytest
+
+from quota import QuotaManager
+from scrape import fetch_via_scrapedo
+
+
+class FakeScrapeDo(ThreadingHTTPServer):
+    """
+    Answers like the Scrape.do API. respond(index, token, url) returns
+    (status, headers); every request is kept in requests as (time, token, url).
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.requests = []
+        self.lock = threading.Lock()
+        self.respond = lambda index, token, url: (200, {'Scrape.do-Request-Cost': '1'})
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        token, url = query['token'][0], query['url'][0]
+        with self.server.lock:
+            index = len(self.server.requests)
+            self.server.requests.append((time.monotonic(), token, url))
+
+        status, headers = self.server.respond(index, token, url)
+        body = f"<html><body><p>Page {url}</p></body></html>".encode() if status == 200 else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    fake = FakeScrapeDo()
+    thread = threading.Thread(target=fake.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('SCRAPEDO_API_URL', fake.url)
+    yield fake
+    fake.shutdown()
+    fake.server_close()
+
+def token_limit(quota, index=0):
+    return quota.stats()['tokens'][index]['concurrency_limit']
+
+
+def test_aimd_halves_on_429_and_grows_back(server):
+    server.respond = lambda index, token, url: (429, {'Retry-After': '0'}) if index == 0 else (200, {})
+    quota = QuotaManager(['t1'], max_concurrency=4, increase_step=1)
+
+    result = fetch_via_scrapedo('https://example.com/a', quota=quota)
+
+    assert result['success']
+    assert len(server.requests) == 2
+    # 4 -> 2 after the 429, +1 after the successful retry
+    assert token_limit(quota) == 3
+    assert quota.stats()['tokens'][0]['throttled'] == 1
+
+    fetch_via_scrapedo('https://example.com/b', quota=quota)
+    assert token_limit(quota) == 4
+    fetch_via_scrapedo('https://example.com/c', quota=quota)
+    assert token_limit(quota) == 4
+
+def test_retry_after_delays_the_retry(server):
+    server.respond = lambda index, token, url: (429, {'Retry-After': '0.5'}) if index == 0 else (200, {})
+    quota = QuotaManager(['t1'])
+
+    result = fetch_via_scrapedo('https://example.com/a', quota=quota)
+
+    assert result['success']
+    (throttled_at, _, _), (retried_at, _, _) = server.requests
+    assert retried_at - throttled_at >= 0.45
+
+def test_budget_holds_with_costly_requests_under_concurrency(server):
+    server.respond = lambda index, token, url: (200, {'Scrape.do-Request-Cost': '5'})
+    quota = QuotaManager(['t1', 't2'], max_concurrency=5, budget=22)
+    results = []
+
+    def worker(n):
+        for i in range(10):
+            results.append(fetch_via_scrapedo(f'https://example.com/{n}/{i}', quota=quota, with_text=False))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    spent = quota.stats()['credits_spent']
+    assert spent == 5 * len(server.requests)
+    assert spent <= 22
+    assert any(result.get('quota_exceeded') for result in results)
+    assert quota.remaining() == 22 - spent
+
+def test_requests_rotate_over_tokens(server):
+    quota = QuotaManager(['t1', 't2', 't3'], max_concurrency=1)
+
+    for i in range(6):
+        assert fetch_via_scrapedo(f'https://example.com/{i}', quota=quota)['success']
+
+    assert [token for _, token, _ in server.requests] == ['t1', 't2', 't3', 't1', 't2', 't3']
+    assert [t['requests'] for t in quota.stats()['tokens']] == [2, 2, 2]
@@ -0,0 +1,198 @@
+"""
+t-store ingestion against recorded getproductslist responses (tests/fixtures/tilda_store)
+served locally through TILDA_STORE_API
+- 'nextslice' pagination, string-encoded json_options, uid dedup
+- a failed store block is recorded and logged with the page
+- products are exported at their store block's position, under its headings
+
+Run from app/: python -m pytest -q tests
+"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+APP_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APP_DIR / 'scrapedo-web-scraper' / 'scripts'))
+sys.path.insert(0, str(APP_DIR))
+
+import pytest
+from bs4 import BeautifulSoup
+
+from content_export import export_items
+from production_scraper_v2 import extract_structured_content, rescrape_all_pages
+from tilda_store import append_store_products, fetch_store_products, find_store_blocks
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures' / 'tilda_store'
+
+STORE_PAGE = """<html><head><title>Каталог</title></head><body>
+<div id="rec123" class="r t-rec" data-record-type="754">
+  <div class="t-store js-store" data-storepart-uid="100"></div>
+</div>
+<div id="rec456" class="r t-rec" data-record-type="776"><div class="t776"></div></div>
+<script>t_store_init('456', {storepart: '200', blocksInRow: 3});</script>
+<p>Каталог оборудования для мониторинга транспорта</p>
+</body></html>"""
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """getproductslist stand-in: getproductslist_<storepartuid>_slice<slice>.json, 500 if not recorded"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/getproductslist/"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(query)
+
+        fixture = FIXTURES / f"getproductslist_{query['storepartuid']}_slice{query['slice']}.json"
+        body = fixture.read_bytes() if fixture.exists() else b'{"error":"Internal error"}'
+        self.send_response(200 if fixture.exists() else 500)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def store_api(monkeypatch):
+    server = FixtureServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv('TILDA_STORE_API', server.url)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def products_by_uid(content_data):
+    return {item['uid']: item for item in content_data['content'] if item['type'] == 'product'}
+
+
+def test_find_store_blocks_from_attribute_and_init_script():
+    blocks = find_store_blocks(BeautifulSoup(STORE_PAGE, 'html.parser'))
+
+    assert blocks == [
+        {'storepart_uid': '100', 'recid': '123', 'record_type': '754'},
+        {'storepart_uid': '200', 'recid': '456', 'record_type': None},
+    ]
+
+def test_pagination_follows_nextslice(store_api):
+    products = fetch_store_products('100', '123')
+
+    assert [product['uid'] for product in products] == ['501', '502', '503', '501']
+    assert [(request['slice'], request['recid']) for request in store_api.requests] == [('1', '123'), ('2', '123')]
+
+def test_products_are_appended_as_items(store_api):
+    content_data = {'content': [], 'store_blocks': find_store_blocks(BeautifulSoup(STORE_PAGE, 'html.parser'))}
+
+    added = append_store_products(content_data)
+
+    assert added == 4
+    assert content_data['store'] == {'blocks': 2, 'products': 4, 'errors': []}
+
+    products = products_by_uid(content_data)
+    assert list(products) == ['501', '502', '503', '601']
+
+    tracker = products['501']
+    assert tracker['text'] == 'Трекер UT-1'
+    assert tracker['price'] == '1 990'
+    assert tracker['price_old'] == '2 490'
+    assert tracker['description'] == 'GPS-трекер для транспорта Работает без подзарядки до 30 дней.'
+    # string-encoded json_options; options without values are dropped
+    assert tracker['options'] == [{'title': 'Цвет', 'values': ['Черный', 'Белый']}]
+    assert (tracker['record_id'], tracker['record_type']) == ('123', '754')
+
+    assert products['502']['options'] == []
+    assert products['503']['price'] == '12 500.5'
+    assert products['503']['price_old'] == ''
+    assert products['503']['description'] == 'Емкостный датчик уровня'
+    assert products['601']['options'] == [{'title': 'Срок', 'values': ['1 день', '3']}]
+    assert products['601']['price'] == ''
+
+def test_failed_block_is_recorded(store_api):
+    content_data = {'content': [], 'store_blocks': [
+        {'storepart_uid': '300', 'recid': '789', 'record_type': '754'},
+        {'storepart_uid': '200', 'recid': '456', 'record_type': None},
+    ]}
+
+    added = append_store_products(content_data)
+
+    assert added == 1
+    assert content_data['store']['products'] == 1
+    [error] = content_data['store']['errors']
+    assert error['storepart_uid'] == '300'
+    assert '500' in error['error']
+
+def test_store_stats_and_errors_are_logged_with_the_page(store_api, tmp_path):
+    page = STORE_PAGE.replace('data-storepart-uid="100"', 'data-storepart-uid="300"')
+    summary_file = tmp_path / 'summary.json'
+
+    rescrape_all_pages(
+        [{'url': 'https://utrace.ru/catalog'}],
+        tmp_path / 'out',
+        summary_file=summary_file,
+        state_file=None,
+        revisit_state_file=None,
+        fetch=lambda url: {'success': True, 'content': '', 'html': page},
+        direct_first=False,
+        request_delay=0,
+    )
+
+    with open(summary_file.with_suffix('.jsonl'), encoding='utf-8') as f:
+        [record] = [json.loads(line) for line in f if line.strip()]
+    assert record['status'] == 'ok'
+    assert record['store']['blocks'] == 2
+    assert record['store']['products'] == 1
+    assert [error['storepart_uid'] for error in record['store']['errors']] == ['300']
+
+    with open(summary_file, encoding='utf-8') as f:
+        assert json.load(f)['store_errors'] == 1
+
+    markdown = (tmp_path / 'out' / 'catalog.md').read_text(encoding='utf-8')
+    assert 'Монтаж оборудования' in markdown
+
+def test_products_are_exported_at_their_store_block(store_api):
+    page = """<html><head><title>Каталог</title></head><body>
+<div id="rec10" class="r t-rec" data-record-type="33"><h2>Трекеры</h2><p>Трекеры для любого транспорта</p></div>
+<div id="rec123" class="r t-rec" data-record-type="754">
+  <div class="t-store js-store" data-storepart-uid="100"></div>
+</div>
+<div id="rec20" class="r t-rec" data-record-type="33"><h2>Контакты</h2><p>Телефон и адрес нашего офиса</p></div>
+</body></html>"""
+    content_data = extract_structured_content(page, 'https://utrace.ru/catalog')
+    append_store_products(content_data)
+
+    items = export_items(content_data)
+
+    assert [item['text'] for item in items] == [
+        'Трекеры', 'Трекеры для любого транспорта', 'Трекер UT-1', 'Трекер UT-2', 'Датчик топлива DT-5',
+        'Контакты', 'Телефон и адрес нашего офиса',
+    ]
+    products = [item for item in items if item['type'] == 'product']
+    assert all(item['heading_path'] == ['Трекеры'] for item in products)
+
+def test_unplaced_products_have_no_heading_path(store_api):
+    content_data = {
+        'content': [{'type': 'heading', 'text': 'Подвал', 'level': 2, 'position': 5}],
+        'store_blocks': [{'storepart_uid': '200', 'recid': None, 'record_type': None, 'position': None}],
+    }
+    append_store_products(content_data)
+
+    heading, product = export_items(content_data)
+
+    assert (heading['text'], product['type']) == ('Подвал', 'product')
+    assert product['heading_path'] == []
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Offline ingestion of Tilda project exports
+- Reads the export zip member by member (nothing is unpacked to disk)
+- Maps pageNNN.html files to public URLs via the export's htaccess, then canonical/og:url
+- Runs the regular rescrape_all_pages with the archive as the fetch source,
+  so output layout, summary and JSONL export match a networked crawl
+
+Usage:
+    python3 tilda_export.py project123456.zip [--base-url https://utrace.ru] [--workers 16]
+"""
+
+import os
+import re
+import sys
+import zipfile
+from pathlib import Path
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'scrapedo-web-scraper' / 'scripts'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from production_scraper_v2 import rescrape_all_pages
+
+HTACCESS_NAMES = ('htaccess', '.htaccess')
+SKIP_PAGES = {'404.html'}
+HEAD_BYTES = 65536
+
+REWRITE_RE = re.compile(r'^\s*RewriteRule\s+\^?([^\s$]*)\$?\s+/?([\w\-.]+\.html)', re.I | re.M)
+DIRECTORY_INDEX_RE = re.compile(r'^\s*DirectoryIndex\s+/?([\w\-.]+\.html)', re.I | re.M)
+TAG_RE = re.compile(r'<(?:link|meta)\b[^>]*>', re.I)
+ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*["\']([^"\']*)["\']')
+
+
+def parse_htaccess(text):
+    """Return {page file: public path} from the export's rewrite rules"""
+    paths = {}
+
+    for target in DIRECTORY_INDEX_RE.findall(text):
+        paths.setdefault(target, '/')
+
+    for alias, target in REWRITE_RE.findall(text):
+        alias = alias.strip('/')
+        # Tilda writes both ^about$ and ^about/$; the first one wins
+        paths.setdefault(target, f"/{alias}" if alias else '/')
+
+    return paths
+
+def declared_url(html):
+    """<link rel="canonical"> or og:url from the page head, if any"""
+    og_url = None
+    for tag in TAG_RE.findall(html[:HEAD_BYTES]):
+        attrs = {name.lower(): value for name, value in ATTR_RE.findall(tag)}
+        if attrs.get('rel', '').lower() == 'canonical' and attrs.get('href', '').startswith('http'):
+            return attrs['href']
+        if attrs.get('property') == 'og:url' and attrs.get('content', '').startswith('http'):
+            og_url = og_url or attrs['content']
+    return og_url
+
+
+class ExportArchive:
+    """A Tilda export zip as a page list plus a fetch function for rescrape_all_pages"""
+
+    def __init__(self, zip_path, base_url=None):
+        self.path = Path(zip_path)
+        self.zip = zipfile.ZipFile(self.path)
+        self.root = self._find_root()
+        self.aliases = self._load_aliases()
+        self.base_url = (base_url or self._discover_base_url() or '').rstrip('/')
+        self.members = {}
+
+        if not self.base_url:
+            raise ValueError(f"{self.path}: no canonical/og:url in pages, pass base_url")
+
+    def _find_root(self):
+        """Directory holding the pages (Tilda puts everything under projectNNN/)"""
+        pages = [name for name in self.zip.namelist() if name.endswith('.html')]
+        roots = {name.rsplit('/', 1)[0] + '/' if '/' in name else '' for name in pages}
+        return min(roots, key=len) if roots else ''
+
+    def _load_aliases(self):
+        for name in HTACCESS_NAMES:
+            try:
+                return parse_htaccess(self.zip.read(self.root + name).decode('utf-8', errors='replace'))
+            except KeyError:
+                continue
+        return {}
+
+    def _discover_base_url(self):
+        for member in self.html_members():
+            url = declared_url(self.read(member))
+            if url:
+                parsed = urlparse(url)
+                return f"{parsed.scheme}://{parsed.netloc}"
+        return None
+
+    def html_members(self):
+        """Page files directly in the export root"""
+        for info in self.zip.infolist():
+            name = info.filename
+            if not name.startswith(self.root) or info.is_dir():
+                continue
+            filename = name[len(self.root):]
+            if '/' in filename or not filename.endswith('.html') or filename in SKIP_PAGES:
+                continue
+            yield name
+
+    def read(self, member):
+        return self.zip.read(member).decode('utf-8', errors='replace')
+
+    def url_for(self, member, html=None):
+        """Public URL: htaccess alias, then canonical/og:url on the same host, then /<file>"""
+        filename = member[len(self.root):]
+        if filename in self.aliases:
+            return self.base_url + self.aliases[filename]
+
+        if filename == 'index.html':
+            return self.base_url + '/'
+
+        declared = declared_url(html if html is not None else self.read(member))
+        if declared and urlparse(declared).netloc == urlparse(self.base_url).netloc:
+            return declared
+
+        return f"{self.base_url}/{filename}"
+
+    def pages(self):
+        """Page dicts ({'url', 'member'}) in archive order"""
+        for member in self.html_members():
+            filename = member[len(self.root):]
+            html = None if filename in self.aliases else self.read(member)
+            url = self.url_for(member, html)
+            self.members[url] = member
+            yield {'url': url, 'member': filename}
+
+    def fetch(self, url):
+        """Stand-in for fetch_via_scrapedo that reads the page from the archive"""
+        member = self.members.get(url)
+        if member is None:
+            return {'success': False, 'content': f"Not in export: {url}"}
+
+        html = self.read(member)
+        return {'success': True, 'content': '', 'html': html, 'route': 'export'}
+
+    def close(self):
+        self.zip.close()
+
+
+def ingest_export(zip_path, base_url=None, output_dir='../result/utrace/scraped_content',
+                  summary_file='../result/utrace/scraping_summary.json', workers=None, export_file=None,
+                  state_file=None, revisit_state_file=None):
+    """
+    Process every page of a Tilda export with rescrape_all_pages.
+
+    workers is the number of parse processes (default: all cores, 0 = in-process).
+    The fetch state and revisit history of networked crawls are left alone
+    unless state_file / revisit_state_file are given.
+    """
+    archive = ExportArchive(zip_path, base_url)
+    print(f"Export: {archive.path.name} -> {archive.base_url} ({len(archive.aliases)} alias(es))")
+
+    try:
+        rescrape_all_pages(
+            archive.pages(),
+            output_dir,
+            summary_file=summary_file,
+            direct_first=False,
+            fetch=archive.fetch,
+            fetch_workers=2,
+            parse_workers=os.cpu_count() or 1 if workers is None else workers,
+            request_delay=0,
+            export_file=export_file,
+            state_file=state_file,
+            revisit_state_file=revisit_state_file,
+        )
+    finally:
+        archive.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ingest a Tilda project export zip without fetching')
+    parser.add_argument('archive', help='Tilda export .zip')
+    parser.add_argument('--base-url', help='Public site URL (default: from canonical/og:url in the pages)')
+    parser.add_argument('--output', default='../result/utrace/scraped_content')
+    parser.add_argument('--summary', default='../result/utrace/scraping_summary.json')
+    parser.add_argument('--workers', type=int, help='Parse processes (default: all cores, 0 = in-process)')
+    parser.add_argument('--export', help='Also write structured content (.jsonl/.jsonl.gz)')
+    parser.add_argument('--state', help='Record fetch times in this fetch state file (default: not recorded)')
+    parser.add_argument('--revisit-state', help='Record visits in this revisit state file (default: not recorded)')
+    args = parser.parse_args()
+
+    ingest_export(args.archive, args.base_url, args.output, args.summary, args.workers, args.export,
+                  args.state, args.revisit_state)
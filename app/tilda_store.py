@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tilda t-store catalog ingestion
+- Detects store blocks (data-storepart-uid) in page HTML
+- Fetches the product list JSON with pagination instead of rendering the page
+- Renders products (title, price, description, options) into the content stream
+"""
+
+import os
+import re
+import json
+import time
+
+from bs4 import BeautifulSoup
+from scrape import get_session
+
+DEFAULT_STORE_API = 'https://store.tildaapi.com/api/getproductslist/'
+
+STORE_PAGE_SIZE = 100
+STORE_MAX_SLICES = 50
+
+STORE_INIT_RE = re.compile(r"t_store_init\(\s*['\"]?(\d+)['\"]?\s*,\s*\{[^}]*?storepart['\"]?\s*:\s*['\"]?(\d+)", re.S)
+
+
+def get_store_api_url():
+    """TILDA_STORE_API (e.g. recorded JSON fixtures served locally) or the public endpoint; read per request"""
+    return os.environ.get('TILDA_STORE_API') or DEFAULT_STORE_API
+
+def find_store_blocks(soup):
+    """Return [{'storepart_uid', 'recid', 'record_type'}] for every t-store block on the page"""
+    blocks = []
+    seen = set()
+
+    def add(storepart_uid, recid, record_type=None):
+        key = (storepart_uid, recid)
+        if storepart_uid and key not in seen:
+            seen.add(key)
+            blocks.append({'storepart_uid': storepart_uid, 'recid': recid, 'record_type': record_type})
+
+    for element in soup.find_all(attrs={'data-storepart-uid': True}):
+        record = element if element.get('data-record-type') else element.find_parent(attrs={'data-record-type': True})
+        recid = None
+        record_type = None
+        if record is not None:
+            recid = (record.get('id') or '').replace('rec', '') or None
+            record_type = record.get('data-record-type')
+        add(element['data-storepart-uid'], recid, record_type)
+
+    # Older blocks only pass the store part to t_store_init() in an inline script
+    for script in soup.find_all('script'):
+        for recid, storepart_uid in STORE_INIT_RE.findall(script.string or ''):
+            add(storepart_uid, recid)
+
+    return blocks
+
+def _html_to_text(value):
+    if not value:
+        return ''
+    text = BeautifulSoup(value, 'html.parser').get_text(separator=' ', strip=True)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def _format_price(value):
+    if value in (None, ''):
+        return ''
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    if number == 0:
+        return ''
+    return f"{number:,.2f}".rstrip('0').rstrip('.').replace(',', ' ')
+
+def _product_options(product):
+    options = product.get('json_options') or []
+    if isinstance(options, str):
+        try:
+            options = json.loads(options)
+        except ValueError:
+            options = []
+
+    result = []
+    for option in options:
+        values = option.get('values') or []
+        if option.get('title') and values:
+            result.append({'title': option['title'], 'values': [str(v) for v in values]})
+    return result
+
+def fetch_store_products(storepart_uid, recid=None, size=STORE_PAGE_SIZE, max_slices=STORE_MAX_SLICES):
+    """Fetch every product of a store part, following 'nextslice' pagination"""
+    products = []
+    slice_num = 1
+
+    for _ in range(max_slices):
+        params = {
+            'storepartuid': storepart_uid,
+            'getparts': 'true',
+            'getoptions': 'true',
+            'slice': slice_num,
+            'size': size,
+            'c': int(time.time() * 1000),
+        }
+        if recid:
+            params['recid'] = recid
+
+        response = get_session().get(get_store_api_url(), params=params, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+
+        batch = data.get('products') or []
+        products.extend(batch)
+
+        next_slice = data.get('nextslice')
+        if not batch or not next_slice:
+            break
+        slice_num = int(next_slice)
+
+    return products
+
+def product_to_item(product, block):
+    """Convert a store API product into a content item at its store block's position (if known)"""
+    description = _html_to_text(product.get('descr'))
+    text = _html_to_text(product.get('text'))
+    if text and text != description:
+        description = f"{description} {text}".strip()
+
+    return {
+        'type': 'product',
+        'text': _html_to_text(product.get('title')) or 'Untitled product',
+        'level': None,
+        'price': _format_price(product.get('price')),
+        'price_old': _format_price(product.get('priceold')),
+        'description': description,
+        'options': _product_options(product),
+        'uid': str(product.get('uid', '')),
+        'position': block.get('position'),
+        'record_id': block.get('recid'),
+        'record_type': block.get('record_type'),
+    }
+
+def append_store_products(content_data):
+    """
+    Fetch products for the store blocks found by the extractor and append them to the content.
+
+    Per-page figures and failed blocks go to content_data['store']
+    ({'blocks', 'products', 'errors'}); the crawl logs them with the page.
+    """
+    blocks = content_data.get('store_blocks') or []
+    seen_uids = set()
+    errors = []
+    added = 0
+
+    for block in blocks:
+        try:
+            products = fetch_store_products(block['storepart_uid'], block.get('recid'))
+        except Exception as e:
+            errors.append({'storepart_uid': block['storepart_uid'], 'error': str(e)})
+            continue
+
+        for product in products:
+            item = product_to_item(product, block)
+            if item['uid'] and item['uid'] in seen_uids:
+                continue
+            seen_uids.add(item['uid'])
+            content_data['content'].append(item)
+            added += 1
+
+    content_data['store'] = {'blocks': len(blocks), 'products': added, 'errors': errors}
+    return added